@@ -35,6 +35,13 @@ LOGIN_REQUIRED_MESSAGES = [
     "has expired due to inactivity",
 ]
 
+NOT_FOUND_MESSAGES = [
+    "NotFound",
+    "not found",
+    "could not be found",
+    "does not exist",
+]
+
 DISTRO_IMAGES = {
     # x86
     'azl3': 'MicrosoftCBLMariner:azure-linux-3:azure-linux-3-gen2:latest',
@@ -383,12 +383,12 @@ class FlagArgConfig(BoolArgConfig):
 
 class NoWaitBoolArgConfig(BoolArgConfig):
     def __init__(self, *, help=None, **kwargs):
-        super().__init__('no_wait', help=help or 'Do not wait for long-running tasks to complete', **kwargs)
+        super().__init__('no_wait', help=help or "Do not wait for long-running tasks to complete (use the 'wait' action to wait for them later)", **kwargs)
 
 
 class NoWaitFlagArgConfig(FlagArgConfig):
     def __init__(self, *, help=None, **kwargs):
-        super().__init__('no_wait', help=help or 'Do not wait for long-running tasks to complete', **kwargs)
+        super().__init__('no_wait', help=help or "Do not wait for long-running tasks to complete (use the 'wait' action to wait for them later)", **kwargs)
 
 
 class YesBoolArgConfig(BoolArgConfig):
@@ -0,0 +1,74 @@
+
+import threading
+
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+
+from .azworker import AZ_WORKERS
+
+
+class AzExecutor:
+    DEFAULT_MAX_WORKERS = 4
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.max_workers = max_workers
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    @max_workers.setter
+    def max_workers(self, max_workers):
+        assert self._executor is None
+        self._max_workers = max(1, max_workers)
+        # Each concurrent az command needs its own az worker
+        AZ_WORKERS.max_workers = self._max_workers
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='ezaz-az',
+                                                    initializer=self._initializer)
+            return self._executor
+
+    def _initializer(self):
+        self._local.is_executor_thread = True
+
+    @property
+    def is_executor_thread(self):
+        return getattr(self._local, 'is_executor_thread', False)
+
+    def _run(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit(self, fn, *args, **kwargs):
+        # If we're already running in one of our threads, just run it
+        # now; otherwise a full pool of tasks that all wait on
+        # sub-tasks would deadlock
+        if self.max_workers == 1 or self.is_executor_thread:
+            return self._run(fn, *args, **kwargs)
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn, *iterables):
+        # Results are returned in order, regardless of completion order
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+AZ_EXECUTOR = AzExecutor()
@@ -1,9 +1,14 @@
 
+import codecs
 import importlib
 import inspect
 import json
+import locale
+import logging
+import operator
 import os
 import subprocess
+import time
 
 from abc import ABC
 from abc import abstractmethod
@@ -11,6 +16,7 @@ from contextlib import contextmanager
 from contextlib import nullcontext
 from contextlib import suppress
 from copy import copy
+from copy import deepcopy
 from functools import cache
 from functools import cached_property
 from itertools import chain
@@ -19,18 +25,27 @@ from .. import AZ_LOGGER
 from .. import IS_ARGCOMPLETE
 from .. import LOGGER
 from .. import LOGIN_REQUIRED_MESSAGES
+from .. import NOT_FOUND_MESSAGES
 from ..actionutil import ActionConfig
 from ..argutil import ArgConfig
 from ..argutil import ArgMap
 from ..argutil import ArgUtil
 from ..argutil import AzObjectArgConfig
 from ..argutil import BoolArgConfig
+from ..argutil import ChoicesArgConfig
 from ..argutil import GroupArgConfig
+from ..argutil import NumberArgConfig
+from ..azexecutor import AZ_EXECUTOR
+from ..azprofile import AZ_PROFILER
+from ..azrecord import AZ_RECORDER
+from ..azretry import AZ_RETRY
+from ..azworker import AZ_WORKERS
 from ..cache import Cache
 from ..cache import CacheExpiry
 from ..config import Config
 from ..exception import AzCommandError
 from ..exception import AzObjectExists
+from ..exception import AzWorkerUnavailable
 from ..exception import CacheError
 from ..exception import DefaultConfigNotFound
 from ..exception import InteractiveLoginRequired
@@ -44,12 +59,19 @@ from ..exception import NullAzObject
 from ..exception import RequiredArgument
 from ..exception import RequiredArgumentGroup
 from ..exception import UnsupportedAction
+from ..exception import WaitFailed
 from ..filter import Filter
+from ..jsonstream import JsonArrayStream
+from ..singleflight import AZ_SINGLE_FLIGHT
 from ..timing import TIMESTAMP
 from .info import Info
 from .info import info_class
 
 
+STDOUT_CHUNK_SIZE = 64 * 1024
+STDOUT_ENCODING = locale.getpreferredencoding(False)
+
+
 class AzAction(ArgUtil, ABC):
     # For auto-importing
     EZAZ_AZOBJECT_CLASS = True
@@ -90,12 +112,33 @@ class AzAction(ArgUtil, ABC):
 
         return cmd
 
-    def _read_stdout_line(self, process):
-        if process.stdout:
-            line = process.stdout.readline()
-            AZ_LOGGER.debug(line.rstrip())
-            return line
-        return ''
+    def _read_stdout_chunks(self, process, text=True):
+        # Read in chunks (instead of lines), since the output from
+        # some commands is very large
+        if not process.stdout:
+            return
+        decoder = codecs.getincrementaldecoder(STDOUT_ENCODING)() if text else None
+        debug = AZ_LOGGER.isEnabledFor(logging.DEBUG)
+        line = ''
+        while True:
+            with AZ_PROFILER.phase('run'):
+                chunk = process.stdout.read1(STDOUT_CHUNK_SIZE)
+            if not chunk:
+                break
+            AZ_PROFILER.add_bytes(len(chunk))
+            if decoder:
+                chunk = decoder.decode(chunk)
+                if debug:
+                    *lines, line = (line + chunk).split('\n')
+                    for l in lines:
+                        AZ_LOGGER.debug(l.rstrip())
+            yield chunk
+        if decoder:
+            chunk = decoder.decode(b'', final=True)
+            if debug and (line + chunk).strip():
+                AZ_LOGGER.debug((line + chunk).rstrip())
+            if chunk:
+                yield chunk
 
     def _check_process(self, process, stdout, stderr):
         if process.returncode == 0:
@@ -107,6 +150,30 @@ class AzAction(ArgUtil, ABC):
             raise InteractiveLoginRequired(stderr)
         raise AzCommandError(process.args, stdout, stderr)
 
+    def _exec_worker(self, cmd, args):
+        start = time.perf_counter()
+        with AZ_PROFILER.phase('run'):
+            process, stdout, stderr = AZ_WORKERS.run(cmd, self._exec_environ)
+        AZ_PROFILER.add_bytes(len(stdout))
+        for line in stdout.splitlines():
+            AZ_LOGGER.debug(line)
+        AZ_RECORDER.record(cmd, stdout, stderr, process.returncode, time.perf_counter() - start)
+        TIMESTAMP(f"{self.__class__.__name__} {' '.join(args)}")
+        self._check_process(process, stdout, stderr)
+        return (stdout, stderr)
+
+    def _popen(self, cmd, capture_output):
+        with AZ_PROFILER.phase('spawn'):
+            return subprocess.Popen(cmd,
+                                    env=self._exec_environ,
+                                    stdout=subprocess.PIPE if capture_output else None,
+                                    stderr=subprocess.PIPE if capture_output else None)
+
+    def _read_stderr(self, process, text=True):
+        with AZ_PROFILER.phase('run'):
+            stderr = process.stderr.read() if process.stderr else b''
+        return stderr.decode(STDOUT_ENCODING) if text else stderr
+
     def _exec(self, *args, cmd_args={}, dry_runnable=True, text=True, capture_output=False):
         cmd = self._args_to_cmd(*args, cmd_args=cmd_args)
 
@@ -116,45 +183,190 @@ class AzAction(ArgUtil, ABC):
             LOGGER.warning(f'DRY-RUN (not running): {" ".join(cmd)}')
             return ('', '')
 
-        process = subprocess.Popen(cmd,
-                                   env=self._exec_environ,
-                                   text=text,
-                                   stdout=subprocess.PIPE if capture_output else None,
-                                   stderr=subprocess.PIPE if capture_output else None)
+        try:
+            with AZ_PROFILER.call(*cmd):
+                return self._exec_cmd_retry(cmd, args, mutating=not dry_runnable, text=text, capture_output=capture_output)
+        finally:
+            if not dry_runnable:
+                # The cmd may have changed things, so results from
+                # earlier cmds can't be reused
+                AZ_SINGLE_FLIGHT.clear()
+
+    def _exec_cmd_retry(self, cmd, args, *, mutating, **kwargs):
+        attempt = 0
+        while True:
+            if cmd[0] == 'az':
+                with AZ_PROFILER.phase('wait'):
+                    AZ_RETRY.bucket.acquire()
+            try:
+                result = self._exec_cmd(cmd, args, **kwargs)
+            except AzCommandError as aze:
+                if not AZ_RETRY.should_retry(attempt, aze.stderr, mutating):
+                    raise
+                with AZ_PROFILER.phase('wait'):
+                    AZ_RETRY.backoff(cmd, attempt, aze.stderr)
+                attempt += 1
+                continue
+            AZ_RETRY.bucket.succeeded()
+            return result
+
+    def _exec_cmd(self, cmd, args, *, text, capture_output):
+        if capture_output and text and cmd[0] == 'az':
+            with suppress(AzWorkerUnavailable):
+                return self._exec_worker(cmd, args)
 
-        stdout = ''
-        while process.poll() is None:
-            stdout += self._read_stdout_line(process)
-        stdout += process.stdout.read() if process.stdout else ''
-        stderr = process.stderr.read() if process.stderr else ''
+        start = time.perf_counter()
+        with self._popen(cmd, capture_output) as process:
+            stdout = ('' if text else b'').join(self._read_stdout_chunks(process, text=text))
+            stderr = self._read_stderr(process, text=text)
+            with AZ_PROFILER.phase('run'):
+                process.wait()
+        if capture_output and text:
+            AZ_RECORDER.record(cmd, stdout, stderr, process.returncode, time.perf_counter() - start)
 
         TIMESTAMP(f"{self.__class__.__name__} {' '.join(args)}")
         self._check_process(process, stdout, stderr)
         return (stdout, stderr)
 
+    def _exec_stream(self, *args, cmd_args={}, dry_runnable=True):
+        # This is a generator of the stdout text chunks, as they are
+        # read; the command is checked for success after the last chunk
+        cmd = self._args_to_cmd(*args, cmd_args=cmd_args)
+
+        AZ_LOGGER.info('$ ' + ' '.join(cmd))
+
+        if self.dry_run and not dry_runnable:
+            LOGGER.warning(f'DRY-RUN (not running): {" ".join(cmd)}')
+            return
+
+        try:
+            yield from self._exec_cmd_stream_retry(cmd, args, mutating=not dry_runnable)
+        finally:
+            if not dry_runnable:
+                AZ_SINGLE_FLIGHT.clear()
+
+    def _exec_cmd_stream_retry(self, cmd, args, *, mutating):
+        attempt = 0
+        while True:
+            if cmd[0] == 'az':
+                with AZ_PROFILER.phase('wait'):
+                    AZ_RETRY.bucket.acquire()
+            started = False
+            try:
+                for chunk in self._exec_cmd_stream(cmd, args):
+                    started = True
+                    yield chunk
+            except AzCommandError as aze:
+                # Can't retry once we've provided any output
+                if started or not AZ_RETRY.should_retry(attempt, aze.stderr, mutating):
+                    raise
+                with AZ_PROFILER.phase('wait'):
+                    AZ_RETRY.backoff(cmd, attempt, aze.stderr)
+                attempt += 1
+                continue
+            AZ_RETRY.bucket.succeeded()
+            return
+
+    def _exec_cmd_stream(self, cmd, args):
+        if cmd[0] == 'az':
+            with suppress(AzWorkerUnavailable):
+                (stdout, stderr) = self._exec_worker(cmd, args)
+                yield stdout
+                return
+
+        start = time.perf_counter()
+        recorded = [] if AZ_RECORDER.enabled else None
+        with self._popen(cmd, True) as process:
+            for chunk in self._read_stdout_chunks(process):
+                if recorded is not None:
+                    recorded.append(chunk)
+                yield chunk
+            stderr = self._read_stderr(process)
+            with AZ_PROFILER.phase('run'):
+                process.wait()
+        if recorded is not None:
+            AZ_RECORDER.record(cmd, ''.join(recorded), stderr, process.returncode, time.perf_counter() - start)
+
+        TIMESTAMP(f"{self.__class__.__name__} {' '.join(args)}")
+        self._check_process(process, '', stderr)
+
     def az(self, *args, **kwargs):
         return self._exec('az', *args, **kwargs)
 
     def az_none(self, *args, **kwargs):
         self.az(*args, **kwargs)
 
+    def _az_single_flight(self, kind, fn, *args, coalesce=True, **kwargs):
+        # Identical read-only cmds share a single execution and result
+        if not coalesce or not kwargs.get('dry_runnable', True):
+            return fn(*args, **kwargs)
+        cmd = self._args_to_cmd('az', *args, cmd_args=kwargs.get('cmd_args', {}))
+        return AZ_SINGLE_FLIGHT((kind, self.verbose, *cmd), fn, *args, **kwargs)
+
     def az_stdout(self, *args, **kwargs):
+        return self._az_single_flight('stdout', self._az_stdout, *args, **kwargs)
+
+    def _az_stdout(self, *args, **kwargs):
         (stdout, stderr) = self.az(*args, capture_output=True, **kwargs)
         return stdout
 
     def az_json(self, *args, **kwargs):
-        stdout = self.az_stdout(*args, **kwargs)
-        return json.loads(stdout) if stdout else {}
+        # The json is shared, so give each caller its own copy
+        return deepcopy(self._az_single_flight('json', self._az_json, *args, **kwargs))
+
+    def _az_json(self, *args, **kwargs):
+        with AZ_PROFILER.call('az', *args):
+            stdout = self._az_stdout(*args, **kwargs)
+            with AZ_PROFILER.phase('decode'):
+                return json.loads(stdout) if stdout else {}
 
     def az_info(self, *args, **kwargs):
-        cls = info_class(args)
-        j = self.az_json(*args, **kwargs)
-        return cls(j, verbose=self.verbose) if j else None
+        # The info is shared, so give each caller its own copy
+        return deepcopy(self._az_single_flight('info', self._az_info, *args, **kwargs))
+
+    def _az_info(self, *args, **kwargs):
+        with AZ_PROFILER.call('az', *args):
+            cls = info_class(args)
+            j = self._az_json(*args, **kwargs)
+            with AZ_PROFILER.phase('info'):
+                if j and '--query' in kwargs.get('cmd_args', {}):
+                    j = cls.strip_projection(j)
+                return cls(j, verbose=self.verbose) if j else None
+
+    def az_stream(self, *args, **kwargs):
+        return self._exec_stream('az', *args, **kwargs)
+
+    def az_json_stream(self, *args, **kwargs):
+        # Yields each element of the az cmd's json array output as soon
+        # as it is read
+        return JsonArrayStream(self.az_stream(*args, **kwargs))
 
     def az_infolist(self, *args, **kwargs):
-        cls = info_class(args)
-        j = self.az_json(*args, **kwargs)
-        return cls(j, verbose=self.verbose) if j else []
+        # The infos are shared, so give each caller its own copies
+        return deepcopy(list(self._az_single_flight('infolist', self._az_infolist, *args, **kwargs)))
+
+    def _az_infolist(self, *args, **kwargs):
+        with AZ_PROFILER.call('az', *args):
+            cls = info_class(args)
+            stream = AZ_PROFILER.iter_phase('decode', self.az_json_stream(*args, **kwargs))
+            if '--query' in kwargs.get('cmd_args', {}):
+                stream = map(cls.info_class.strip_projection, stream)
+            with AZ_PROFILER.phase('info'):
+                return cls(stream, verbose=self.verbose)
+
+    # These return a Future for the az command, which may be running
+    # in parallel with other az commands
+    def az_stdout_async(self, *args, **kwargs):
+        return AZ_EXECUTOR.submit(self.az_stdout, *args, **kwargs)
+
+    def az_json_async(self, *args, **kwargs):
+        return AZ_EXECUTOR.submit(self.az_json, *args, **kwargs)
+
+    def az_info_async(self, *args, **kwargs):
+        return AZ_EXECUTOR.submit(self.az_info, *args, **kwargs)
+
+    def az_infolist_async(self, *args, **kwargs):
+        return AZ_EXECUTOR.submit(self.az_infolist, *args, **kwargs)
 
 
 class TreeObject:
@@ -267,7 +479,22 @@ class TreeObject:
     def get_children(self, name, no_filters=True):
         return []
 
-    def _for_each_descendant_instance(self, callback, opts=None, *, context_manager=None, include_self=False, no_filters=False):
+    @cached_property
+    def _prefetched_children(self):
+        return {}
+
+    def get_children_async(self, name, no_filters=True):
+        # Use (and consume) the prefetch for these children, if any
+        with suppress(KeyError):
+            return self._prefetched_children.pop((name, no_filters))
+        return AZ_EXECUTOR.submit(self.get_children, name, no_filters=no_filters)
+
+    def prefetch_children(self, name, no_filters=True):
+        key = (name, no_filters)
+        if key not in self._prefetched_children:
+            self._prefetched_children[key] = AZ_EXECUTOR.submit(self.get_children, name, no_filters=no_filters)
+
+    def _for_each_descendant_instance(self, callback, opts=None, *, context_manager=None, include_self=False, no_filters=False, prefetch=None):
         assert callable(callback)
         if include_self:
             try:
@@ -276,10 +503,22 @@ class TreeObject:
                 # This skips iterating this instance's children, it
                 # doesn't end the recursive iteration
                 return
-        for childcls in self.get_child_classes():
-            for child in self.get_children(childcls.azobject_name(), no_filters=no_filters):
+        # Get the lists of all our child types in parallel, but
+        # iterate them in order so the results are deterministic
+        futures = [self.get_children_async(childcls.azobject_name(), no_filters=no_filters)
+                   for childcls in self.get_child_classes()]
+        for future in futures:
+            children = future.result()
+            if prefetch:
+                # Also start getting the lists of the children's
+                # children, if the caller wants
+                for child in children:
+                    for grandchildcls in child.get_child_classes():
+                        if prefetch(child, grandchildcls):
+                            child.prefetch_children(grandchildcls.azobject_name(), no_filters=no_filters)
+            for child in children:
                 with (context_manager or nullcontext)():
-                    for result in child.for_each_descendant_instance(callback, opts, context_manager=context_manager, include_self=True, no_filters=no_filters):
+                    for result in child.for_each_descendant_instance(callback, opts, context_manager=context_manager, include_self=True, no_filters=no_filters, prefetch=prefetch):
                         yield result
 
     def for_each_descendant_instance(self, *args, **kwargs):
@@ -402,6 +641,8 @@ class AzObject(AzAction, TreeObject):
                            context_manager=None,
                            get_instance=None,
                            dry_runnable=None,
+                           query_projection=None,
+                           query_projection_fields=None,
                            azaction_class=None,
                            **kwargs):
         if aliases is None:
@@ -434,6 +675,10 @@ class AzObject(AzAction, TreeObject):
             az = getattr(cls, f'get_{action}_action_az', lambda: None)()
         if cmd is None:
             cmd = getattr(cls, f'get_{action}_action_cmd', lambda: None)()
+        if query_projection is None:
+            query_projection = getattr(cls, f'get_{action}_action_query_projection', lambda: False)()
+        if query_projection_fields is None:
+            query_projection_fields = getattr(cls, f'{action}_query_projection_fields', None)
         if do_action_pre is None:
             do_action_pre = getattr(cls, f'do_{action}_action_pre', None)
         if do_action_post is None:
@@ -458,6 +703,8 @@ class AzObject(AzAction, TreeObject):
                               context_manager=context_manager,
                               get_instance=get_instance,
                               dry_runnable=dry_runnable,
+                              query_projection=query_projection,
+                              query_projection_fields=query_projection_fields,
                               **kwargs)
 
     @classmethod
@@ -555,9 +802,10 @@ class AzObject(AzAction, TreeObject):
     def cache_expiry_key(cls, name):
         return f'cache_expiry_{name}'
 
-    def __init__(self, *, azobject_id, cachedir=None, no_cache=False, is_null=False, **kwargs):
+    def __init__(self, *, azobject_id, cachedir=None, cache_backend=None, no_cache=False, is_null=False, **kwargs):
         super().__init__(**kwargs)
         self._cachedir = cachedir
+        self._cache_backend = cache_backend
         self._no_cache = no_cache
         self._azobject_id = azobject_id
         self.is_null = is_null
@@ -577,6 +825,7 @@ class AzObject(AzAction, TreeObject):
     def _cache(self):
         if not getattr(self.__class__, '_class_cache', None):
             self.__class__._class_cache = Cache(cachepath=self._cachedir,
+                                                backend=self._cache_backend,
                                                 verbose=self.verbose,
                                                 dry_run=self.dry_run,
                                                 no_cache_read=self._no_cache,
@@ -589,7 +838,7 @@ class AzObject(AzAction, TreeObject):
         return CacheExpiry(self.config.get_object(self.default_cache_expiry_key()))
 
     def find_cache_expiry(self, name):
-        return self.cache_expiry(name) or self.default_cache_expiry()
+        return self.cache_expiry(name).merged(self.default_cache_expiry())
 
     def cache_expiry(self, name):
         if self.is_null:
@@ -599,8 +848,17 @@ class AzObject(AzAction, TreeObject):
     @cached_property
     def cache(self):
         if self.is_null:
-            return self._cache.class_cache(self.default_cache_expiry(), self.azobject_name())
-        return self._cache.object_cache(self.find_cache_expiry(self.azobject_name()), self.azobject_name(), self.azobject_id)
+            return self._cache.class_cache(self.default_cache_expiry(), self.azobject_name(), refresh=self.cache_refresh)
+        return self._cache.object_cache(self.find_cache_expiry(self.azobject_name()), self.azobject_name(), self.azobject_id, refresh=self.cache_refresh)
+
+    def cache_refresh(self, cachetype):
+        # Our cache entry is expired, but still usable, so refresh it in
+        # the background; a list refresh also refreshes all show entries
+        from ..cacherefresh import start_refresh
+        if cachetype == 'show' and not self.is_null and isinstance(self, AzShowable):
+            start_refresh(self, 'show')
+        elif isinstance(self, AzListable):
+            start_refresh(self if self.is_null else self.get_null_instance(**self.get_azobject_id_opts()), 'list')
 
     @cached_property
     def config(self):
@@ -614,6 +872,12 @@ class AzObject(AzAction, TreeObject):
             raise NullAzObject('azobject_id')
         return self._azobject_id
 
+    @property
+    def azobject_id_path(self):
+        # Our id, after all our ancestors' ids; objects in different
+        # parents may have the same id
+        return (self.azobject_id,)
+
     def get_azobject_id_opts(self, **opts):
         if not self.is_null:
             return self.set_azobject_id_in_opts(self.azobject_id, opts, replace=False)
@@ -684,7 +948,7 @@ class AzSubObject(AzObject):
 
     @classmethod
     def instance_cache(cls, **opts):
-        return cls._instance_cache(cls.get_parent_instance(**opts).azobject_id)
+        return cls._instance_cache(cls.get_parent_instance(**opts).azobject_id_path)
 
     @classmethod
     def default_key(cls):
@@ -742,17 +1006,21 @@ class AzSubObject(AzObject):
     def parent(self):
         return self._parent
 
+    @property
+    def azobject_id_path(self):
+        return (*self.parent.azobject_id_path, self.azobject_id)
+
     def default_cache_expiry(self):
         return self.parent.default_cache_expiry()
 
     def find_cache_expiry(self, name):
-        return self.cache_expiry(name) or self.parent.find_cache_expiry(name)
+        return self.cache_expiry(name).merged(self.parent.find_cache_expiry(name))
 
     @cached_property
     def cache(self):
         if self.is_null:
-            return self.parent.cache.child_class_cache(self.parent.find_cache_expiry(self.azobject_name()), self.azobject_name())
-        return self.parent.cache.child_object_cache(self.find_cache_expiry(self.azobject_name()), self.azobject_name(), self.azobject_id)
+            return self.parent.cache.child_class_cache(self.parent.find_cache_expiry(self.azobject_name()), self.azobject_name(), refresh=self.cache_refresh)
+        return self.parent.cache.child_object_cache(self.find_cache_expiry(self.azobject_name()), self.azobject_name(), self.azobject_id, refresh=self.cache_refresh)
 
     @cached_property
     def config(self):
@@ -857,6 +1125,10 @@ class AzShowable(AzObject):
     def get_show_action_az(cls):
         return 'info'
 
+    @classmethod
+    def get_show_action_query_projection(cls):
+        return True
+
     @classmethod
     def get_show_action_description(cls):
         return f'Show a {cls.azobject_text()}'
@@ -871,6 +1143,10 @@ class AzShowable(AzObject):
         try:
             yield
         except AzCommandError as aze:
+            # Only remember that it doesn't exist if az says so, not
+            # for other failures
+            if any((s in (aze.stderr or '') for s in NOT_FOUND_MESSAGES)):
+                self.show_write_absent_cache()
             raise NoAzObjectExists(self.azobject_text(), self.azobject_id) from aze
 
     def info(self):
@@ -879,6 +1155,9 @@ class AzShowable(AzObject):
     def show_pre(self, opts):
         with suppress(CacheError):
             return self.cache.read_info()
+        with suppress(CacheError):
+            self.cache.read_absent()
+            raise NoAzObjectExists(self.azobject_text(), self.azobject_id)
         return None
 
     def show(self, **opts):
@@ -891,6 +1170,9 @@ class AzShowable(AzObject):
     def show_write_cache(self, info):
         self.cache.write_info(info=info)
 
+    def show_write_absent_cache(self):
+        self.cache.write_absent()
+
 
 class AzListable(AzObject):
     @classmethod
@@ -909,6 +1191,10 @@ class AzListable(AzObject):
     def get_list_action_az(cls):
         return 'infolist'
 
+    @classmethod
+    def get_list_action_query_projection(cls):
+        return True
+
     @classmethod
     def get_list_action_get_instance(cls):
         return cls.get_null_instance
@@ -966,6 +1252,9 @@ class AzListable(AzObject):
             filters.extend(self.get_filters(**opts))
         return filters
 
+    def list_query_projection_fields(self, opts):
+        return [f.field for f in self.list_filters(opts) if f.field]
+
     def list_filter(self, infolist, filters, opts):
         try:
             return [info for info in infolist if all((f.check(info) for f in filters))]
@@ -1010,6 +1299,9 @@ class AzListable(AzObject):
     def list(self, **opts):
         return self.do_action_config_instance_action('list', opts)
 
+    def list_async(self, **opts):
+        return AZ_EXECUTOR.submit(self.list, **opts)
+
     def list_post(self, infolist, opts):
         try:
             self.list_write_cache(infolist)
@@ -1019,25 +1311,26 @@ class AzListable(AzObject):
             TIMESTAMP(f'{self.__class__.__name__}.list_post()')
 
     def list_write_cache(self, infolist, tag=None):
-        # Invalidate all existing show caches, as they may have been
-        # removed and our list should include all still valid
-        self.cache.invalidate_show_all()
+        with self.cache.transaction():
+            # Invalidate all existing show caches, as they may have been
+            # removed and our list should include all still valid
+            self.cache.invalidate_show_all()
 
-        # Write the info list cache
-        self.cache.write_info_list(infolist=infolist, tag=tag)
+            # Write the info list cache
+            self.cache.write_info_list(infolist=infolist, tag=tag)
 
-        # Write the id list cache
-        self.id_list_write_cache([info._id for info in infolist], tag=tag)
+            # Write the id list cache
+            self.id_list_write_cache([info._id for info in infolist], tag=tag)
 
-        # Write the show caches
-        self.list_infos_write_cache(infolist)
+            # Write the show caches, as references into the list cache
+            self.list_infos_write_cache(infolist, tag=tag)
 
     def id_list_write_cache(self, idlist, tag=None):
         self.cache.write_id_list(idlist=idlist, tag=tag)
 
-    def list_infos_write_cache(self, infolist):
+    def list_infos_write_cache(self, infolist, tag=None):
         for info in infolist:
-            self.cache.write_info(objid=info._id, info=info)
+            self.cache.write_info_ref(objid=info._id, tag=tag)
 
 
 class AzCreatable(AzObject):
@@ -1075,12 +1368,26 @@ class AzCreatable(AzObject):
         return self.do_action_config_instance_action('create', opts, include_self=False)
 
     def create_post(self, result, opts):
-        self.create_invalidate_cache()
+        self.create_update_cache(result)
         return result
 
+    def create_update_cache(self, result, tag=None):
+        # If az returned our info, add it to the cached lists (keeping
+        # their expiry), instead of invalidating them
+        if not isinstance(result, Info) or result._id != self.azobject_id:
+            self.create_invalidate_cache(tag=tag)
+            return
+        with self.cache.transaction():
+            self.cache.update_info_list(tag=tag, add=[result])
+            self.cache.update_id_list(tag=tag, add=[result._id])
+            self.cache.write_info(info=result)
+            self.cache.invalidate_absent()
+
     def create_invalidate_cache(self, tag=None):
         self.cache.invalidate_info_list(tag=tag)
+        self.cache.invalidate_id_list(tag=tag)
         self.cache.invalidate_info()
+        self.cache.invalidate_absent()
 
 
 class AzDeletable(AzObject):
@@ -1114,12 +1421,124 @@ class AzDeletable(AzObject):
         return self.do_action_config_instance_action('delete', opts, include_self=False)
 
     def delete_post(self, result, opts):
-        self.delete_invalidate_cache()
+        self.delete_update_cache()
         return result
 
-    def delete_invalidate_cache(self, tag=None):
-        self.cache.invalidate_info_list(tag=tag)
-        self.cache.invalidate_info()
+    def delete_update_cache(self, tag=None):
+        # Remove us from the cached lists (keeping their expiry),
+        # instead of invalidating them
+        with self.cache.transaction():
+            self.cache.update_info_list(tag=tag, remove=[self.azobject_id])
+            self.cache.update_id_list(tag=tag, remove=[self.azobject_id])
+            self.cache.invalidate_info()
+
+
+class AzWaitable(AzShowable):
+    @classmethod
+    def get_action_configs(cls):
+        return [*super().get_action_configs(), cls.get_wait_action_config()]
+
+    @classmethod
+    def get_wait_action_config(cls):
+        return cls.make_action_config('wait')
+
+    @classmethod
+    def get_wait_action_description(cls):
+        return f'Wait for a {cls.azobject_text()} to finish provisioning (or to be deleted)'
+
+    @classmethod
+    def get_wait_action_dry_runnable(cls):
+        return True
+
+    @classmethod
+    def get_wait_action_get_instance(cls):
+        return cls.get_wait_instance
+
+    @classmethod
+    def get_wait_instance(cls, **opts):
+        # With --all, the null instance waits for all its siblings
+        if opts.get('all'):
+            return cls.get_null_instance(**opts)
+        return cls.get_instance(**opts)
+
+    @classmethod
+    def get_wait_conditions(cls):
+        return ['provisioned', 'deleted']
+
+    @classmethod
+    def get_wait_provisioning_state_attr(cls):
+        return 'provisioningState'
+
+    @classmethod
+    def get_wait_action_argconfigs(cls):
+        return [ChoicesArgConfig('for',
+                                 dest='wait_for',
+                                 choices=cls.get_wait_conditions(),
+                                 default='provisioned',
+                                 noncmd=True,
+                                 help='Condition to wait for (default: provisioned)'),
+                NumberArgConfig('timeout',
+                                noncmd=True,
+                                help='Maximum number of seconds to wait'),
+                BoolArgConfig('all',
+                              noncmd=True,
+                              help=f'Wait for all (filtered) {cls.azobject_text()}s, e.g. after changing them with --no-wait')]
+
+    def wait_pre(self, opts):
+        from ..waiter import AZ_WAITER
+        condition = opts.get('wait_for') or 'provisioned'
+        azobjects = self.parent.get_children(self.azobject_name(), no_filters=False) if self.is_null else [self]
+        if self.dry_run:
+            LOGGER.warning(f'DRY-RUN (not waiting): {condition} {" ".join(o.azobject_id for o in azobjects)}')
+            return []
+        states = AZ_WAITER.wait(azobjects, condition, timeout=opts.get('timeout'))
+        return [f'{o.azobject_id}: {state}' for o, state in zip(azobjects, states)]
+
+    def wait(self, **opts):
+        return self.do_action_config_instance_action('wait', opts)
+
+    def wait_poll(self, action='show'):
+        # This always runs the cmd, bypassing (but still updating) the
+        # show cache
+        config = self.get_action_config(action)
+        try:
+            info = self.az_info(*config.cmd,
+                                cmd_args=config.cmd_args(**self.get_azobject_id_opts()),
+                                dry_runnable=True,
+                                coalesce=False)
+        except AzCommandError as aze:
+            # Only a not found error means it's deleted; any other
+            # failure (auth, throttling, network) fails the wait
+            if not any((s in (aze.stderr or '') for s in NOT_FOUND_MESSAGES)):
+                raise
+            if action == 'show':
+                self.show_write_absent_cache()
+            raise NoAzObjectExists(self.azobject_text(), self.azobject_id) from aze
+        if not info:
+            raise NoAzObjectExists(self.azobject_text(), self.azobject_id)
+        if action == 'show':
+            self.show_write_cache(info)
+        return info
+
+    def wait_state(self, condition):
+        with suppress(AttributeError):
+            return operator.attrgetter(self.get_wait_provisioning_state_attr())(self.wait_poll())
+        return 'Unknown'
+
+    def wait_check(self, condition):
+        # Returns (done, state)
+        try:
+            state = self.wait_state(condition)
+        except NoAzObjectExists:
+            # It won't reach any other condition once it's gone
+            if condition != 'deleted':
+                raise WaitFailed(self.azobject_text(), self.azobject_id, condition, 'Deleted')
+            return (True, 'Deleted')
+        if condition == 'provisioned':
+            if state.lower() in ['failed', 'canceled']:
+                raise WaitFailed(self.azobject_text(), self.azobject_id, condition, state)
+            return (state.lower() == 'succeeded', state)
+        return (False, state)
 
 
 # Do not ever actually call the show command, always use the list
@@ -1137,6 +1556,7 @@ class AzEmulateShowable(AzShowable, AzListable):
             if info._id == self.azobject_id:
                 return info
 
+        self.show_write_absent_cache()
         raise NoAzObjectExists(self.azobject_text(), self.azobject_id)
 
 
@@ -1153,6 +1573,9 @@ class AzCommonActionable(AzRoActionable, AzRwActionable):
 
 
 class AzActionConfig(ActionConfig):
+    # Set to use a --query projection for the actions that support it
+    QUERY_PROJECTION = False
+
     def __init__(self,
                  action,
                  *,
@@ -1161,6 +1584,8 @@ class AzActionConfig(ActionConfig):
                  cmd=None,
                  az=None,
                  dry_runnable=False,
+                 query_projection=False,
+                 query_projection_fields=None,
                  parse_opts=None,
                  do_action_pre=None,
                  do_action_post=None,
@@ -1175,6 +1600,8 @@ class AzActionConfig(ActionConfig):
         self.cmd = cmd or azclass.get_cmd_base() + [action]
         self.az = az or 'none'
         self.dry_runnable = dry_runnable
+        self.query_projection = query_projection
+        self.query_projection_fields = query_projection_fields or (lambda azobject, opts: [])
         self.do_action_pre = do_action_pre or (lambda opts: opts)
         self.do_action_post = do_action_post or (lambda result: result)
         self.pre = pre or (lambda azobject, opts: None)
@@ -1198,5 +1625,26 @@ class AzActionConfig(ActionConfig):
 
         az = getattr(azobject, f'az_{self.az}')
 
-        with self.context_manager(azobject):
-            return self.post(azobject, az(*self.cmd, cmd_args=self.cmd_args(**opts), dry_runnable=self.dry_runnable), opts)
+        cmd_args = self.cmd_args(**opts)
+        query = self.get_query_projection(azobject, opts)
+        if query:
+            cmd_args = cmd_args | {'--query': query}
+
+        # Projected infos are missing fields, so they must not be cached
+        with self.context_manager(azobject), azobject.cache.temporary_no_cache_write() if query else nullcontext():
+            return self.post(azobject, az(*self.cmd, cmd_args=cmd_args, dry_runnable=self.dry_runnable), opts)
+
+    def get_query_projection(self, azobject, opts):
+        # Verbose level 3 shows the full info, so don't project it
+        if not self.QUERY_PROJECTION or not self.query_projection or azobject.verbose >= 3:
+            return None
+        if self.az not in ['info', 'infolist']:
+            return None
+        with suppress(RuntimeError, AttributeError):
+            cls = info_class(self.cmd)
+            if self.az == 'infolist':
+                cls = cls.info_class
+                query = cls.query_projection(self.query_projection_fields(azobject, opts))
+                return f'[].{query}' if query else None
+            return cls.query_projection(self.query_projection_fields(azobject, opts))
+        return None
@@ -1,4 +1,6 @@
 
+import threading
+
 from abc import abstractmethod
 from collections import defaultdict
 from contextlib import suppress
@@ -23,6 +25,11 @@ from .info import Info
 
 
 class ComputeSku(AzEmulateShowable, AzListable, AzSubObject):
+    # The sku list is shared by all our subclasses, which may be listed
+    # in parallel, so only warn once per location
+    _list_warned = set()
+    _list_warned_lock = threading.Lock()
+
     @classmethod
     def get_cmd_base(cls):
         return ['vm']
@@ -134,7 +141,12 @@ class ComputeSku(AzEmulateShowable, AzListable, AzSubObject):
         if result is None:
             if IS_ARGCOMPLETE:
                 raise TooLongForArgcomplete(self.azobject_short_name(), 'list')
-            LOGGER.warning('Getting VM SKU list; this command takes a long time, please be patient...')
+            location = (self.parent.parent.azobject_id, self.parent.azobject_id)
+            with ComputeSku._list_warned_lock:
+                warn = location not in ComputeSku._list_warned
+                ComputeSku._list_warned.add(location)
+            if warn:
+                LOGGER.warning('Getting VM SKU list; this command takes a long time, please be patient...')
         return result
 
     def list_write_cache(self, infolist):
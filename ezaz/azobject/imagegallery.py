@@ -2,9 +2,10 @@
 from ..argutil import NoWaitBoolArgConfig
 from .azobject import AzCommonActionable
 from .azobject import AzSubObjectContainer
+from .azobject import AzWaitable
 
 
-class ImageGallery(AzCommonActionable, AzSubObjectContainer):
+class ImageGallery(AzCommonActionable, AzWaitable, AzSubObjectContainer):
     @classmethod
     def azobject_name_list(cls):
         return ['image', 'gallery']
@@ -14,6 +15,14 @@ class ImageGallery(AzCommonActionable, AzSubObjectContainer):
         from .resourcegroup import ResourceGroup
         return ResourceGroup
 
+    @classmethod
+    def get_resource_graph_type(cls):
+        return 'microsoft.compute/galleries'
+
+    @classmethod
+    def get_resource_type(cls):
+        return 'Microsoft.Compute/galleries'
+
     @classmethod
     def get_child_classes(cls):
         from .imagedefinition import ImageDefinition
@@ -5,9 +5,10 @@ from ..argutil import NoWaitBoolArgConfig
 from ..argutil import NoWaitFlagArgConfig
 from .azobject import AzCommonActionable
 from .azobject import AzSubObject
+from .azobject import AzWaitable
 
 
-class ImageVersion(AzCommonActionable, AzSubObject):
+class ImageVersion(AzCommonActionable, AzWaitable, AzSubObject):
     @classmethod
     def azobject_name_list(cls):
         return ['image', 'version']
@@ -1,5 +1,4 @@
 
-import importlib
 import json
 import jsonschema
 import operator
@@ -7,37 +6,70 @@ import operator
 from contextlib import suppress
 from copy import deepcopy
 
+from ..azprofile import AZ_PROFILER
+from ..cachecompress import decompress
 from ..dictnamespace import DictNamespace
 from ..exception import InvalidInfo
+from ..exception import InvalidInfoVersion
 from ..schema import *
 from ..timing import TIMESTAMP
 
 
 class Info(DictNamespace):
     __slots__ = ('_verbose',)
-    SAVE_MODULE_KEY = 'ezaz_info_module'
-    SAVE_CLASS_KEY = 'ezaz_info_class'
+    # Saved infos start with a header line, with the format version and
+    # the Info class name, followed by the json; a saved info list has a
+    # line for each info, with its id and json separated by a tab, so
+    # one info can be found without decoding the entire list. Entries
+    # saved in another format are discarded
+    SAVE_VERSION = 3
+    SAVE_HEADER = 'ezaz-info'
+
+    # The Info classes, by name, for loading saved infos; this includes
+    # those (e.g. CapabilityInfo) not in INFOS
+    _classes = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        assert cls.__name__ not in Info._classes
+        Info._classes[cls.__name__] = cls
+
+    @classmethod
+    def _save_header(cls, infocls):
+        return f'{cls.SAVE_HEADER} {cls.SAVE_VERSION} {infocls.__name__}\n'
+
+    @classmethod
+    def _load_header(cls, content):
+        # Returns (Info class name, json content)
+        header, _, content = content.partition('\n')
+        try:
+            name, version, infoclsname = header.split(' ')
+        except ValueError:
+            name = version = infoclsname = None
+        if name != cls.SAVE_HEADER or version != str(cls.SAVE_VERSION):
+            raise InvalidInfoVersion(f'Info is not saved in format version {cls.SAVE_VERSION}')
+        return (infoclsname, content)
+
+    @classmethod
+    def _load_class(cls, infoclsname):
+        infocls = Info._classes.get(infoclsname)
+        if not infocls:
+            raise InvalidInfo(f'No Info class found: {infoclsname}')
+        return infocls
 
     @classmethod
     def load(cls, content, verbose):
         if not content:
             return None
         try:
+            infoclsname, content = cls._load_header(decompress(content))
             obj = json.loads(content)
-        except json.decoder.JSONDecodeError as jde:
-            raise InvalidInfo(f'Failed to decode info: {content}') from jde
-        return cls._load(obj, verbose=verbose)
+        except ValueError as ve:
+            raise InvalidInfo(f'Failed to decode info: {content}') from ve
+        return cls._load(cls._load_class(infoclsname), obj, verbose=verbose)
 
     @classmethod
-    def _load(cls, obj, verbose):
-        infomodname = obj.pop(cls.SAVE_MODULE_KEY, None) or cls.__module__
-        infoclsname = obj.pop(cls.SAVE_CLASS_KEY, None)
-        if not infoclsname:
-            raise InvalidInfo('Info does not contain its class name')
-        infomod = importlib.import_module(infomodname)
-        infocls = getattr(infomod, infoclsname, None)
-        if not infocls:
-            raise InvalidInfo(f'No Info class found: {infomodname}.{infoclsname}')
+    def _load(cls, infocls, obj, verbose):
         try:
             return infocls(obj, verbose=verbose)
         except jsonschema.exceptions.ValidationError as ve:
@@ -48,33 +80,65 @@ class Info(DictNamespace):
         if not content:
             return []
         try:
-            objs = json.loads(content)
-        except json.decoder.JSONDecodeError as jde:
-            raise InvalidInfo(f'Failed to decode info list: {content}') from jde
-        if not isinstance(objs, list):
-            raise InvalidInfo(f'Info list is not a list: {content}')
+            infoclsname, content = cls._load_header(decompress(content))
+            objs = json.loads('[' + ','.join(line.partition('\t')[2] for line in content.splitlines()) + ']')
+        except ValueError as ve:
+            raise InvalidInfo(f'Failed to decode info list: {content}') from ve
+        if not objs:
+            return []
+        infocls = cls._load_class(infoclsname)
         try:
-            return [cls._load(obj, verbose) for obj in objs]
+            return [cls._load(infocls, obj, verbose) for obj in objs]
         finally:
             TIMESTAMP('Info.load_list()')
 
+    @classmethod
+    def load_list_info(cls, content, infoid, verbose):
+        # Returns the info from a saved info list, or None if it isn't in
+        # the list
+        try:
+            infoclsname, content = cls._load_header(decompress(content))
+            key = f'\n{json.dumps(infoid)}\t'
+            start = ('\n' + content).find(key)
+            if start < 0:
+                return None
+            line = content[start + len(key) - 1:].partition('\n')[0]
+            obj = json.loads(line)
+        except ValueError as ve:
+            raise InvalidInfo(f'Failed to decode info list: {content}') from ve
+        return cls._load(cls._load_class(infoclsname), obj, verbose=verbose)
+
     @classmethod
     def save_list(cls, infos):
         assert all([isinstance(info, Info) for info in infos])
-        return json.dumps([info._save() for info in infos])
+        infocls = type(infos[0]) if infos else cls
+        assert all([type(info) is infocls for info in infos])
+        return cls._save_header(infocls) + ''.join(f'{json.dumps(info._id)}\t{json.dumps(info._to_object())}\n' for info in infos)
 
     def __init__(self, info, *, verbose):
         super().__init__(info)
         self._verbose = verbose
 
-    def _save(self):
-        return self._to_object() | {
-            self.SAVE_MODULE_KEY: self.__class__.__module__,
-            self.SAVE_CLASS_KEY: self.__class__.__name__,
-        }
+    def _validate(self):
+        with AZ_PROFILER.phase('validate'):
+            super()._validate()
 
     def save(self):
-        return json.dumps(self._save())
+        return self._save_header(self.__class__) + json.dumps(self._to_object())
+
+    # Fields used outside of the schema, which a query projection must
+    # also include
+    _projection_fields = ()
+
+    @classmethod
+    def query_projection(cls, fields=()):
+        id_fields = [cls._id_attr, cls._id0_attr, cls._id1_attr, cls._id2_attr]
+        id_fields = [f for f in id_fields if f and f != '_id']
+        return QUERY_PROJECTION(cls._schema or {}, [*id_fields, *cls._projection_fields, *fields])
+
+    @classmethod
+    def strip_projection(cls, obj):
+        return STRIP_PROJECTION(cls._schema or {}, obj)
 
     # Main id attribute, will be used for azobject_id
     _id_attr = 'name'
@@ -145,6 +209,8 @@ class AccountInfo(Info):
         ),
     )
 
+    _projection_fields = ('tenantDefaultDomain',)
+
 
 class ConfigVarInfo(Info):
     _schema = OBJ(
@@ -320,6 +386,8 @@ class NicInfo(Info):
         resourceGuid=STR,
     )
 
+    _projection_fields = ('primary',)
+
     @property
     def primary(self):
         # Seems like it's simply missing when it's not True
@@ -456,6 +524,8 @@ class VmInfo(Info):
         ),
     )
 
+    _projection_fields = ('diagnosticsProfile',)
+
     _id1_attr = 'vmId'
 
 
@@ -532,11 +602,15 @@ class ComputeSkuInfo(Info):
         ),
     )
 
+    _projection_fields = ('restrictions',)
+
     _id2_attr = None
 
 
 def IL(info):
-    return lambda infos, verbose=0: [info(i, verbose=verbose) for i in infos]
+    infolist = lambda infos, verbose=0: [info(i, verbose=verbose) for i in infos]
+    infolist.info_class = info
+    return infolist
 
 INFOS = DictNamespace({
     'account': {
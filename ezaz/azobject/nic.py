@@ -18,6 +18,14 @@ class Nic(AzRoActionable, AzSubObjectContainer):
         from .resourcegroup import ResourceGroup
         return ResourceGroup
 
+    @classmethod
+    def get_resource_graph_type(cls):
+        return 'microsoft.network/networkinterfaces'
+
+    @classmethod
+    def get_resource_type(cls):
+        return 'Microsoft.Network/networkInterfaces'
+
     @classmethod
     def get_child_classes(cls):
         from .nicipaddr import NicIpAddr
@@ -17,6 +17,14 @@ class PublicIp(AzRoActionable, AzSubObject):
         from .resourcegroup import ResourceGroup
         return ResourceGroup
 
+    @classmethod
+    def get_resource_graph_type(cls):
+        return 'microsoft.network/publicipaddresses'
+
+    @classmethod
+    def get_resource_type(cls):
+        return 'Microsoft.Network/publicIPAddresses'
+
     @classmethod
     def get_self_id_argconfig_cmddest(cls, is_parent):
         return 'name'
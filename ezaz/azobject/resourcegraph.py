@@ -0,0 +1,126 @@
+
+from collections import defaultdict
+from contextlib import suppress
+
+import jsonschema
+
+from .. import LOGGER
+from .azobject import AzAction
+from .info import info_class
+
+
+class ResourceGraph(AzAction):
+    # This uses a single (paged) Azure Resource Graph query per
+    # subscription to fill the list, id_list, and show caches of all
+    # resource groups, and all their child objects.
+    PAGE_SIZE = 1000
+
+    @classmethod
+    def get_resource_group_class(cls):
+        from .resourcegroup import ResourceGroup
+        return ResourceGroup
+
+    @classmethod
+    def get_resource_classes(cls):
+        return [c for c in cls.get_resource_group_class().get_child_classes()
+                if hasattr(c, 'get_resource_graph_type')]
+
+    @classmethod
+    def get_info_class(cls, azclass):
+        return info_class([*azclass.get_cmd_base(), 'list']).info_class
+
+    @classmethod
+    def get_query(cls):
+        types = ', '.join(f"'{c.get_resource_graph_type()}'" for c in cls.get_resource_classes())
+        rgtype = cls.get_resource_group_class().get_resource_graph_type()
+        return (f'Resources | where type in~ ({types}) | '
+                f"union (ResourceContainers | where type =~ '{rgtype}')")
+
+    def query(self, query, subscription_id):
+        skip_token = None
+        while True:
+            cmd_args = {'--graph-query': query,
+                        '--subscriptions': subscription_id,
+                        '--first': self.PAGE_SIZE}
+            if skip_token:
+                cmd_args['--skip-token'] = skip_token
+            result = self.az_json('graph', 'query', cmd_args=cmd_args)
+            yield from result.get('data', [])
+            skip_token = result.get('skip_token') or result.get('skipToken')
+            if not skip_token:
+                return
+
+    # Columns of every resource graph row that the az cmds don't output
+    GRAPH_ONLY_COLUMNS = ['tenantId', 'subscriptionId']
+    # Columns of every resource graph row that the az cmds only output
+    # for resources that have them
+    OPTIONAL_COLUMNS = ['kind', 'managedBy', 'sku', 'plan', 'identity', 'zones', 'extendedLocation']
+    # Resource properties that only the resource graph has
+    GRAPH_ONLY_PROPERTIES = ['extended']
+    # The fields that 'az group list' outputs
+    RESOURCE_GROUP_FIELDS = ['id', 'location', 'managedBy', 'name', 'properties', 'tags']
+
+    def row_resource_group(self, row):
+        # The resource graph provides the resource group name in
+        # lowercase, so use the name from the id
+        idparts = row.get('id', '').split('/')
+        with suppress(ValueError):
+            return idparts[[p.lower() for p in idparts].index('resourcegroups') + 1]
+        return None
+
+    def row_to_info(self, azclass, row):
+        # Returns the row as the az cmds output it; the graph's type is
+        # in lowercase
+        if azclass is self.get_resource_group_class():
+            obj = {k: row.get(k) for k in self.RESOURCE_GROUP_FIELDS}
+            # The graph has an empty string instead of null
+            obj['managedBy'] = obj['managedBy'] or None
+        else:
+            # The az cmds flatten the 'properties' into the object
+            obj = {k: v for k, v in row.items()
+                   if k not in self.GRAPH_ONLY_COLUMNS + ['properties']
+                   and not (k in self.OPTIONAL_COLUMNS and not v)}
+            for k, v in (row.get('properties') or {}).items():
+                if k not in self.GRAPH_ONLY_PROPERTIES:
+                    obj.setdefault(k, v)
+            obj['resourceGroup'] = self.row_resource_group(row)
+        obj['type'] = azclass.get_resource_type()
+        return obj
+
+    def make_infolist(self, azclass, rows):
+        infocls = self.get_info_class(azclass)
+        try:
+            return [infocls(self.row_to_info(azclass, row), verbose=self.verbose) for row in rows]
+        except jsonschema.exceptions.ValidationError as ve:
+            LOGGER.debug(f'Resource graph info does not match {infocls.__name__}: {ve.message}')
+            return None
+
+    def load_subscription(self, subscription):
+        rgclass = self.get_resource_group_class()
+        rows = defaultdict(list)
+        for row in self.query(self.get_query(), subscription.info().id):
+            rgtype = row.get('type', '').lower()
+            if rgtype == rgclass.get_resource_graph_type():
+                rows[rgtype].append(row)
+            else:
+                rg = (self.row_resource_group(row) or '').lower()
+                rows[(rgtype, rg)].append(row)
+
+        count = 0
+        rginfolist = self.make_infolist(rgclass, rows[rgclass.get_resource_graph_type()])
+        if rginfolist is None:
+            return count
+        subscription.get_null_child(rgclass.azobject_name()).list_write_cache(rginfolist)
+        count += len(rginfolist)
+
+        for rginfo in rginfolist:
+            rg = subscription.get_child(rgclass.azobject_name(), rginfo._id, info=rginfo)
+            for azclass in self.get_resource_classes():
+                # This writes empty lists too, since the query found
+                # all objects of the type
+                infolist = self.make_infolist(azclass, rows[(azclass.get_resource_graph_type(), rginfo._id.lower())])
+                if infolist is None:
+                    continue
+                rg.get_null_child(azclass.azobject_name()).list_write_cache(infolist)
+                count += len(infolist)
+        return count
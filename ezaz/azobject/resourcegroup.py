@@ -8,9 +8,10 @@ from ..argutil import NoWaitFlagArgConfig
 from ..argutil import YesFlagArgConfig
 from .azobject import AzCommonActionable
 from .azobject import AzSubObjectContainer
+from .azobject import AzWaitable
 
 
-class ResourceGroup(AzCommonActionable, AzSubObjectContainer):
+class ResourceGroup(AzCommonActionable, AzWaitable, AzSubObjectContainer):
     @classmethod
     def azobject_name_list(cls):
         return ['resource', 'group']
@@ -20,6 +21,14 @@ class ResourceGroup(AzCommonActionable, AzSubObjectContainer):
         from .subscription import Subscription
         return Subscription
 
+    @classmethod
+    def get_resource_graph_type(cls):
+        return 'microsoft.resources/subscriptions/resourcegroups'
+
+    @classmethod
+    def get_resource_type(cls):
+        return 'Microsoft.Resources/resourceGroups'
+
     @classmethod
     def get_child_classes(cls):
         from .imagegallery import ImageGallery
@@ -34,6 +43,10 @@ class ResourceGroup(AzCommonActionable, AzSubObjectContainer):
     def get_cmd_base(cls):
         return ['group']
 
+    @classmethod
+    def get_wait_provisioning_state_attr(cls):
+        return 'properties.provisioningState'
+
     @classmethod
     def get_action_configs(cls):
         return [*super().get_action_configs(),
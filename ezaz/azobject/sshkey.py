@@ -28,6 +28,14 @@ class SshKey(AzCommonActionable, AzSubObject):
         from .resourcegroup import ResourceGroup
         return ResourceGroup
 
+    @classmethod
+    def get_resource_graph_type(cls):
+        return 'microsoft.compute/sshpublickeys'
+
+    @classmethod
+    def get_resource_type(cls):
+        return 'Microsoft.Compute/sshPublicKeys'
+
     @classmethod
     def get_self_id_argconfig_cmddest(cls, is_parent):
         return 'ssh_public_key_name'
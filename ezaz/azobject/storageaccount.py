@@ -17,6 +17,14 @@ class StorageAccount(AzCommonActionable, AzSubObjectContainer):
         from .resourcegroup import ResourceGroup
         return ResourceGroup
 
+    @classmethod
+    def get_resource_graph_type(cls):
+        return 'microsoft.storage/storageaccounts'
+
+    @classmethod
+    def get_resource_type(cls):
+        return 'Microsoft.Storage/storageAccounts'
+
     @classmethod
     def get_child_classes(cls):
         from .storagecontainer import StorageContainer
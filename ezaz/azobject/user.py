@@ -7,6 +7,7 @@ from functools import cached_property
 from .. import LOGGER
 from ..argutil import ArgConfig
 from ..argutil import FlagArgConfig
+from ..azworker import AZ_WORKERS
 from ..cache import CacheExpiry
 from ..exception import AlreadyLoggedIn
 from ..exception import AlreadyLoggedOut
@@ -127,14 +128,14 @@ class User(AzShowable, AzListable, AzObjectContainer):
         v = None
         try:
             with suppress(AzCommandError):
-                v = self.az_info('config', 'get', cmd_args={'core.login_experience_v2': None}).value
-            self.az_stdout('config', 'set', 'core.login_experience_v2=off')
+                v = self.az_info('config', 'get', cmd_args={'core.login_experience_v2': None}, coalesce=False).value
+            self.az_stdout('config', 'set', 'core.login_experience_v2=off', coalesce=False)
             yield
         finally:
             if v is None:
-                self.az_stdout('config', 'unset', 'core.login_experience_v2')
+                self.az_stdout('config', 'unset', 'core.login_experience_v2', coalesce=False)
             elif v:
-                self.az_stdout('config', 'set', f'core.login_experience_v2={v}')
+                self.az_stdout('config', 'set', f'core.login_experience_v2={v}', coalesce=False)
 
     def login_pre(self, opts):
         if self.is_logged_in:
@@ -147,6 +148,8 @@ class User(AzShowable, AzListable, AzObjectContainer):
         self.do_action_config_instance_action('login', opts)
 
     def login_post(self, result, opts):
+        # The az worker may still have the old login state loaded
+        AZ_WORKERS.close()
         with suppress(DefaultConfigNotFound):
             # Switch subscriptions, if needed
             from .subscription import Subscription
@@ -164,6 +167,7 @@ class User(AzShowable, AzListable, AzObjectContainer):
         self.do_action_config_instance_action('logout', opts)
 
     def logout_post(self, result, opts):
+        AZ_WORKERS.close()
         self.cache.clear()
         self._instance_cache.cache_clear()
         return result
@@ -24,9 +24,10 @@ from ..exception import InvalidArgumentValue
 from ..exception import NoPrimaryNic
 from .azobject import AzCommonActionable
 from .azobject import AzSubObjectContainer
+from .azobject import AzWaitable
 
 
-class Vm(AzCommonActionable, AzSubObjectContainer):
+class Vm(AzCommonActionable, AzWaitable, AzSubObjectContainer):
     @classmethod
     def azobject_name_list(cls):
         return ['vm']
@@ -36,6 +37,14 @@ class Vm(AzCommonActionable, AzSubObjectContainer):
         from .resourcegroup import ResourceGroup
         return ResourceGroup
 
+    @classmethod
+    def get_resource_graph_type(cls):
+        return 'microsoft.compute/virtualmachines'
+
+    @classmethod
+    def get_resource_type(cls):
+        return 'Microsoft.Compute/virtualMachines'
+
     @classmethod
     def get_child_classes(cls):
         from .vmnic import VmNic
@@ -175,6 +184,10 @@ class Vm(AzCommonActionable, AzSubObjectContainer):
         return [FlagArgConfig('force', dest='skip_shutdown', help='Force stop of the virtual machine'),
                 NoWaitFlagArgConfig()]
 
+    @classmethod
+    def get_wait_conditions(cls):
+        return [*super().get_wait_conditions(), 'running', 'stopped', 'deallocated']
+
     @classmethod
     def get_enable_boot_diagnostics_actioncfg(cls):
         # This isn't currently included in the user-facing actions;
@@ -212,6 +225,22 @@ class Vm(AzCommonActionable, AzSubObjectContainer):
     def enable_boot_diagnostics(self, **opts):
         self.get_enable_boot_diagnostics_actioncfg().do_instance_action(self, self.get_azobject_id_opts(**opts))
 
+    def wait_state(self, condition):
+        if condition not in ['running', 'stopped', 'deallocated']:
+            return super().wait_state(condition)
+        # The power state is only in the instance view
+        with suppress(AttributeError):
+            for status in self.wait_poll('status').instanceView.statuses:
+                if status.code.startswith('PowerState/'):
+                    return status.code.removeprefix('PowerState/')
+        return 'unknown'
+
+    def wait_check(self, condition):
+        if condition not in ['running', 'stopped', 'deallocated']:
+            return super().wait_check(condition)
+        state = self.wait_state(condition)
+        return (state == condition, state)
+
     @property
     def is_boot_diagnostics_enabled(self):
         with suppress(AttributeError):
@@ -0,0 +1,137 @@
+
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import takewhile
+
+
+def command_path(cmd):
+    # The cmd words, without any options, e.g. 'az vm list'
+    return ' '.join(takewhile(lambda arg: not arg.startswith('-'), cmd))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class AzCallProfile:
+    # The phases are exclusive; when a phase starts inside another
+    # phase, the outer phase is paused until the inner phase ends
+    def __init__(self, path):
+        self.path = path
+        self.phases = defaultdict(float)
+        self.bytes = 0
+        self.total = 0
+        self._start = time.perf_counter()
+        self._stack = []
+
+    def _pause(self, now):
+        if self._stack:
+            name, since = self._stack[-1]
+            self.phases[name] += now - since
+
+    @contextmanager
+    def phase(self, name):
+        now = time.perf_counter()
+        self._pause(now)
+        self._stack.append((name, now))
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._pause(now)
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1] = (self._stack[-1][0], now)
+
+    def finish(self):
+        self.total = time.perf_counter() - self._start
+
+
+class AzProfiler:
+    # Profiles each az call, from the outermost az_json/az_info/
+    # az_infolist/_exec call in the thread; nested calls are part of
+    # the outer call's profile
+    PHASES = ('wait', 'spawn', 'run', 'decode', 'info', 'validate')
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._calls = []
+
+    @property
+    def current(self):
+        return getattr(self._local, 'call', None)
+
+    @contextmanager
+    def call(self, *cmd):
+        if not self.enabled or self.current:
+            yield
+            return
+        call = AzCallProfile(command_path(cmd))
+        self._local.call = call
+        try:
+            yield
+        finally:
+            self._local.call = None
+            call.finish()
+            with self._lock:
+                self._calls.append(call)
+
+    @contextmanager
+    def phase(self, name):
+        call = self.current
+        if not call:
+            yield
+            return
+        with call.phase(name):
+            yield
+
+    def iter_phase(self, name, iterable):
+        # Times only the production of each item, not its use
+        it = iter(iterable)
+        while True:
+            with self.phase(name):
+                item = next(it, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def add_bytes(self, n):
+        call = self.current
+        if call:
+            call.bytes += n
+
+    def show(self, dest=None):
+        with self._lock:
+            calls = list(self._calls)
+        if not calls:
+            return
+
+        bypath = defaultdict(list)
+        for call in calls:
+            bypath[call.path].append(call)
+
+        header = ['command', 'count', 'total', 'p50', 'p95', *self.PHASES, 'bytes']
+        rows = []
+        for path, pathcalls in sorted(bypath.items(), key=lambda i: -sum(c.total for c in i[1])):
+            totals = [c.total for c in pathcalls]
+            rows.append([path,
+                         str(len(pathcalls)),
+                         f'{sum(totals):.3f}',
+                         f'{percentile(totals, 50):.3f}',
+                         f'{percentile(totals, 95):.3f}',
+                         *(f'{sum(c.phases[p] for c in pathcalls):.3f}' for p in self.PHASES),
+                         str(sum(c.bytes for c in pathcalls))])
+
+        widths = [max(map(len, col)) for col in zip(header, *rows)]
+        print(file=dest)
+        for row in [header, *rows]:
+            print(' '.join([row[0].ljust(widths[0]), *(v.rjust(w) for v, w in zip(row[1:], widths[1:]))]), file=dest)
+
+
+AZ_PROFILER = AzProfiler()
@@ -0,0 +1,394 @@
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+from pathlib import Path
+
+
+# Recording/replay of az commands, so ezaz can be run (and benchmarked)
+# without any network access or azure subscription.
+#
+# To record, set EZAZ_AZ_RECORD=DIR (or use 'ezaz --az-record DIR');
+# each az command's args, stdout, stderr, returncode, and duration
+# will be saved in DIR.
+#
+# To replay, install the replay shim with
+#   python3 -m ezaz.azrecord install-shim SHIMDIR
+# and run ezaz with SHIMDIR first in PATH, and EZAZ_AZ_REPLAY=DIR. The
+# replay latency can be set with EZAZ_AZ_REPLAY_LATENCY to a number of
+# seconds, or 'recorded' to use each recording's duration.
+#
+# Large fake recordings can be created with
+#   python3 -m ezaz.azrecord synthesize DIR
+
+
+def normalize_args(args):
+    # Options may be provided in any order
+    words = []
+    options = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if not arg.startswith('-'):
+            words.append(arg)
+            continue
+        option = [arg]
+        while args and not args[0].startswith('-'):
+            option.append(args.pop(0))
+        options.append(option)
+    return [*words, *map(' '.join, sorted(options))]
+
+
+def command_words(args):
+    return [arg for arg in normalize_args(args) if not arg.startswith('-')]
+
+
+def recording_name(args):
+    key = json.dumps(normalize_args(args))
+    return hashlib.sha256(key.encode()).hexdigest() + '.json'
+
+
+def write_recording(path, args, *, stdout='', stderr='', returncode=0, duration=0):
+    recording = {
+        'args': list(args),
+        'stdout': stdout,
+        'stderr': stderr,
+        'returncode': returncode,
+        'duration': duration,
+    }
+    tmpfile = path / f'.{recording_name(args)}.{os.getpid()}'
+    tmpfile.write_text(json.dumps(recording))
+    tmpfile.replace(path / recording_name(args))
+
+
+class AzRecorder:
+    def __init__(self):
+        self.path = None
+        if os.environ.get('EZAZ_AZ_RECORD'):
+            self.start(os.environ.get('EZAZ_AZ_RECORD'))
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def start(self, path):
+        self.path = Path(path).expanduser().resolve()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def record(self, cmd, stdout, stderr, returncode, duration):
+        if not self.enabled or cmd[0] != 'az':
+            return
+        write_recording(self.path, cmd[1:],
+                        stdout=stdout,
+                        stderr=stderr,
+                        returncode=returncode,
+                        duration=duration)
+
+
+AZ_RECORDER = AzRecorder()
+
+
+class AzReplay:
+    def __init__(self, path, latency=None):
+        self.path = Path(path).expanduser().resolve()
+        self.latency = latency
+
+    def find(self, args):
+        # Use the exact recording if possible; otherwise use the
+        # default recording for the command, if there is one
+        for name in (recording_name(args), recording_name(command_words(args))):
+            with_path = self.path / name
+            if with_path.is_file():
+                return json.loads(with_path.read_text())
+        return None
+
+    def delay(self, recording):
+        if self.latency == 'recorded':
+            time.sleep(recording.get('duration') or 0)
+        elif self.latency:
+            time.sleep(float(self.latency))
+
+    def run(self, args):
+        recording = self.find(args)
+        if not recording:
+            print(f"ERROR: (ResourceNotFound) No recorded az response for: az {' '.join(args)}", file=sys.stderr)
+            return 3
+        self.delay(recording)
+        sys.stdout.write(recording.get('stdout') or '')
+        sys.stderr.write(recording.get('stderr') or '')
+        return recording.get('returncode') or 0
+
+
+def install_shim(path):
+    path = Path(path).expanduser().resolve()
+    path.mkdir(parents=True, exist_ok=True)
+    shim = path / 'az'
+    pythonpath = Path(__file__).resolve().parent.parent
+    shim.write_text('#!/bin/sh\n'
+                    f'PYTHONPATH="{pythonpath}" exec "{sys.executable}" -m ezaz.azrecord replay -- "$@"\n')
+    shim.chmod(0o755)
+    print(f"Installed az replay shim at {shim}; put '{path}' first in PATH and set EZAZ_AZ_REPLAY")
+
+
+class AzSynthesizer:
+    # Writes recordings for a fake user, with subscriptions that contain
+    # resource groups, vms, locations, and skus; all other list
+    # commands return no objects
+    # The columns of every resource graph row
+    GRAPH_COLUMNS = ['id', 'name', 'type', 'tenantId', 'kind', 'location', 'resourceGroup', 'subscriptionId',
+                     'managedBy', 'sku', 'plan', 'properties', 'tags', 'identity', 'zones', 'extendedLocation']
+
+    def __init__(self, path, *, subscriptions, groups, vms, locations, skus, seed):
+        self.path = Path(path).expanduser().resolve()
+        self.subscriptions = subscriptions
+        self.groups = groups
+        self.vms = vms
+        self.locations = [f'location{n}' for n in range(locations)]
+        self.skus = skus
+        self.random = random.Random(seed)
+        self.count = 0
+
+    def uuid(self):
+        return '-'.join(self.random.randbytes(n).hex() for n in (4, 2, 2, 2, 6))
+
+    def write(self, args, result):
+        write_recording(self.path, args, stdout=json.dumps(result, indent=2) + '\n')
+        self.count += 1
+
+    def write_default_lists(self):
+        from .azobject.info import INFOS
+
+        def list_cmds(namespace, cmd):
+            for k, v in namespace.items():
+                if isinstance(v, dict):
+                    yield from list_cmds(v, cmd + [k])
+                elif k.startswith('list') and hasattr(v, 'info_class'):
+                    yield cmd + [k]
+
+        for cmd in list_cmds(INFOS._to_object(), []):
+            self.write(cmd, [])
+
+    def user(self):
+        return {
+            'id': self.uuid(),
+            'displayName': 'Fake User',
+            'userPrincipalName': 'fake.user@example.com',
+        }
+
+    def subscription(self, n, tenant):
+        return {
+            'id': self.uuid(),
+            'name': f'subscription{n}',
+            'isDefault': n == 0,
+            'state': 'Enabled',
+            'tenantId': tenant,
+            'tenantDefaultDomain': 'example.com',
+            'user': {'name': 'fake.user@example.com', 'type': 'user'},
+        }
+
+    def location(self, sub, name):
+        return {
+            'id': f"/subscriptions/{sub['id']}/locations/{name}",
+            'name': name,
+            'displayName': name.title(),
+            'regionalDisplayName': f'(Fake) {name.title()}',
+            'type': 'Region',
+        }
+
+    def group(self, sub, n):
+        name = f'group{n}'
+        return {
+            'id': f"/subscriptions/{sub['id']}/resourceGroups/{name}",
+            'location': self.random.choice(self.locations),
+            'managedBy': None,
+            'name': name,
+            'properties': {'provisioningState': 'Succeeded'},
+            'tags': None,
+            'type': 'Microsoft.Resources/resourceGroups',
+        }
+
+    def vm(self, group, n):
+        name = f"{group['name']}-vm{n}"
+        return {
+            'id': f"{group['id']}/providers/Microsoft.Compute/virtualMachines/{name}",
+            'name': name,
+            'type': 'Microsoft.Compute/virtualMachines',
+            'location': group['location'],
+            'resourceGroup': group['name'],
+            'timeCreated': '2025-01-01T00:00:00.000000+00:00',
+            'vmId': self.uuid(),
+            'tags': {'owner': 'fake'},
+            'diagnosticsProfile': {'bootDiagnostics': {'enabled': True, 'storageUri': None}},
+            'hardwareProfile': {'vmSize': 'Standard_D2s_v5'},
+            'provisioningState': 'Succeeded',
+        }
+
+    def vm_instance_view(self, vm):
+        return {
+            **vm,
+            'osProfile': {'adminUsername': 'fake', 'computerName': vm['name']},
+            'storageProfile': {
+                'diskControllerType': 'SCSI',
+                'imageReference': {},
+                'osDisk': {
+                    'caching': 'ReadWrite',
+                    'createOption': 'FromImage',
+                    'deleteOption': 'Delete',
+                    'diskSizeGB': 30,
+                    'managedDisk': {'id': f"{vm['id']}-osdisk", 'resourceGroup': vm['resourceGroup'], 'storageAccountType': 'Premium_LRS'},
+                    'name': f"{vm['name']}-osdisk",
+                    'osType': 'Linux',
+                },
+            },
+            'instanceView': {
+                'statuses': [{'code': 'ProvisioningState/succeeded', 'displayStatus': 'Provisioning succeeded'},
+                             {'code': 'PowerState/running', 'displayStatus': 'VM running'}],
+            },
+        }
+
+    def sku(self, n):
+        return {
+            'name': f'Standard_Fake{n}_v1',
+            'resourceType': 'virtualMachines',
+            'locations': [self.random.choice(self.locations)],
+            'locationInfo': [],
+            'capabilities': [{'name': 'vCPUs', 'value': str(2 ** (n % 6))},
+                             {'name': 'MemoryGB', 'value': str(4 * 2 ** (n % 6))}],
+            'restrictions': [],
+        }
+
+    def graph_row(self, sub, obj, resource_type, *, container=False, extended=None):
+        # Like a real resource graph row, made from the az cmd output:
+        # all columns are present, with an empty string for an unset
+        # kind and managedBy; the type and resource group are in
+        # lowercase; and, except for containers (e.g. groups) which
+        # keep theirs, the fields that the az cmd flattened are in the
+        # 'properties' (along with the graph-only 'extended' ones)
+        if container:
+            properties = obj.get('properties')
+        else:
+            properties = {k: v for k, v in obj.items() if k not in self.GRAPH_COLUMNS}
+            if extended:
+                properties['extended'] = extended
+        return {
+            **dict.fromkeys(self.GRAPH_COLUMNS),
+            **{k: v for k, v in obj.items() if k in self.GRAPH_COLUMNS},
+            'type': resource_type,
+            'tenantId': sub['tenantId'],
+            'kind': obj.get('kind') or '',
+            'resourceGroup': obj.get('resourceGroup', obj['name']).lower(),
+            'subscriptionId': sub['id'],
+            'managedBy': obj.get('managedBy') or '',
+            'properties': properties,
+        }
+
+    def write_graph_query(self, sub, rows):
+        from .azobject.resourcegraph import ResourceGraph
+        page_size = ResourceGraph.PAGE_SIZE
+        pages = [rows[n:n + page_size] for n in range(0, len(rows), page_size)] or [[]]
+        for n, page in enumerate(pages):
+            args = ['graph', 'query',
+                    '--graph-query', ResourceGraph.get_query(),
+                    '--subscriptions', sub['id'],
+                    '--first', str(page_size)]
+            if n > 0:
+                args.extend(['--skip-token', f'page{n}'])
+            self.write(args, {
+                'count': len(page),
+                'data': page,
+                'skip_token': f'page{n + 1}' if n + 1 < len(pages) else None,
+                'total_records': len(rows),
+            })
+
+    def synthesize(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.write_default_lists()
+
+        user = self.user()
+        self.write(['ad', 'signed-in-user', 'show'], user)
+        self.write(['ad', 'user', 'show', '--id', user['id']], user)
+
+        tenant = self.uuid()
+        subscriptions = [self.subscription(n, tenant) for n in range(self.subscriptions)]
+        self.write(['account', 'list'], subscriptions)
+        self.write(['account', 'show'], subscriptions[0])
+        self.write(['account', 'list-locations'], [self.location(subscriptions[0], l) for l in self.locations])
+
+        skus = [self.sku(n) for n in range(self.skus)]
+        for sub in subscriptions:
+            subargs = ['--subscription', sub['name']]
+            self.write(['account', 'show', *subargs], sub)
+            for location in self.locations:
+                self.write(['vm', 'list-skus', '--all', '--location', location, *subargs],
+                           [sku for sku in skus if location in sku['locations']])
+
+            groups = [self.group(sub, n) for n in range(self.groups)]
+            self.write(['group', 'list', *subargs], groups)
+            graph_rows = [self.graph_row(sub, group, 'microsoft.resources/subscriptions/resourcegroups', container=True)
+                          for group in groups]
+            for group in groups:
+                groupargs = ['--resource-group', group['name'], *subargs]
+                self.write(['group', 'show', '--resource-group', group['name'], *subargs], group)
+                vms = [self.vm(group, n) for n in range(self.vms)]
+                self.write(['vm', 'list', *groupargs], vms)
+                for vm in vms:
+                    self.write(['vm', 'show', '--name', vm['name'], *groupargs], vm)
+                    self.write(['vm', 'get-instance-view', '--name', vm['name'], *groupargs], self.vm_instance_view(vm))
+                graph_rows.extend(self.graph_row(sub, vm, 'microsoft.compute/virtualmachines',
+                                                 extended={'instanceView': {'powerState': {'code': 'PowerState/running'}}})
+                                  for vm in vms)
+            self.write_graph_query(sub, graph_rows)
+
+        print(f'Wrote {self.count} recordings to {self.path}')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m ezaz.azrecord",
+                                     description='Replay or synthesize recorded az commands')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    replay = subparsers.add_parser('replay', help='Replay an az command (this is what the shim runs)')
+    replay.add_argument('args', nargs=argparse.REMAINDER)
+
+    shim = subparsers.add_parser('install-shim', help="Install an 'az' replay shim in a directory")
+    shim.add_argument('path')
+
+    synth = subparsers.add_parser('synthesize', help='Create recordings for a large fake account')
+    synth.add_argument('path')
+    synth.add_argument('--subscriptions', type=int, default=2)
+    synth.add_argument('--groups', type=int, default=1000, help='Resource groups per subscription')
+    synth.add_argument('--vms', type=int, default=5, help='VMs per resource group')
+    synth.add_argument('--locations', type=int, default=20)
+    synth.add_argument('--skus', type=int, default=1000)
+    synth.add_argument('--seed', type=int, default=0)
+
+    options = parser.parse_args()
+
+    if options.action == 'replay':
+        args = options.args[1:] if options.args[:1] == ['--'] else options.args
+        path = os.environ.get('EZAZ_AZ_REPLAY')
+        if not path:
+            print('ERROR: EZAZ_AZ_REPLAY is not set', file=sys.stderr)
+            return 1
+        return AzReplay(path, os.environ.get('EZAZ_AZ_REPLAY_LATENCY')).run(args)
+    if options.action == 'install-shim':
+        install_shim(options.path)
+        return 0
+    if options.action == 'synthesize':
+        AzSynthesizer(options.path,
+                      subscriptions=options.subscriptions,
+                      groups=options.groups,
+                      vms=options.vms,
+                      locations=options.locations,
+                      skus=options.skus,
+                      seed=options.seed).synthesize()
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
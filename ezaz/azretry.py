@@ -0,0 +1,121 @@
+
+import random
+import re
+import threading
+import time
+
+from contextlib import suppress
+
+from . import LOGGER
+
+
+# Status codes are only matched as ARM error codes or status lines, not
+# as bare numbers, which may be part of e.g. a resource name
+THROTTLED_MESSAGES = [
+    re.compile(r'TooManyRequests|Too Many Requests', re.IGNORECASE),
+    re.compile(r'RequestsThrottled'),
+    re.compile(r'\(429\)'),
+    re.compile(r'status code:? 429\b', re.IGNORECASE),
+    re.compile(r'rate limit exceeded', re.IGNORECASE),
+]
+
+TRANSIENT_MESSAGES = [
+    re.compile(r'ServiceUnavailable|Service Unavailable', re.IGNORECASE),
+    re.compile(r'BadGateway|Bad Gateway', re.IGNORECASE),
+    re.compile(r'GatewayTimeout|Gateway Timeout', re.IGNORECASE),
+    re.compile(r'\(50[234]\)'),
+    re.compile(r'status code:? 50[234]\b', re.IGNORECASE),
+    re.compile(r'timed out', re.IGNORECASE),
+    re.compile(r'Connection (reset|aborted)', re.IGNORECASE),
+    re.compile(r'Max retries exceeded', re.IGNORECASE),
+]
+
+RETRY_AFTER = re.compile(r"retry[- ]?after\D{0,8}(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+class AzTokenBucket:
+    # Shared by all (possibly parallel) az commands. When any command
+    # is throttled, all commands wait out the throttling delay, and the
+    # rate is cut in half; it then slowly increases back to the max.
+    MAX_RATE = 10.0
+    MIN_RATE = 0.5
+    RATE_INCREASE = 0.1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rate = self.MAX_RATE
+        self._tokens = self.MAX_RATE
+        self._last = time.monotonic()
+        self._paused_until = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = max(self._paused_until - now, -self._tokens / self.rate)
+        if wait > 0:
+            time.sleep(wait)
+
+    def throttled(self, delay):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self.rate = max(self.MIN_RATE, self.rate / 2)
+
+    def succeeded(self):
+        if self.rate < self.MAX_RATE:
+            with self._lock:
+                self.rate = min(self.MAX_RATE, self.rate + self.RATE_INCREASE)
+
+
+class AzRetryPolicy:
+    DEFAULT_MAX_RETRIES = 5
+    BASE_DELAY = 1.0
+    MAX_DELAY = 60.0
+
+    def __init__(self):
+        self.max_retries = self.DEFAULT_MAX_RETRIES
+        self.bucket = AzTokenBucket()
+
+    def is_throttled(self, stderr):
+        return any(m.search(stderr or '') for m in THROTTLED_MESSAGES)
+
+    def is_transient(self, stderr):
+        return any(m.search(stderr or '') for m in TRANSIENT_MESSAGES)
+
+    def retry_after(self, stderr):
+        with suppress(AttributeError, ValueError):
+            return float(RETRY_AFTER.search(stderr or '').group(1))
+        return None
+
+    def delay(self, attempt, stderr):
+        # Full jitter exponential backoff, but never less than the
+        # server asked us to wait
+        delay = random.uniform(0, min(self.MAX_DELAY, self.BASE_DELAY * 2 ** attempt))
+        return max(delay, self.retry_after(stderr) or 0)
+
+    def should_retry(self, attempt, stderr, mutating):
+        if attempt >= self.max_retries:
+            return False
+        if self.is_throttled(stderr):
+            # Throttled requests were rejected without doing anything,
+            # so even mutating cmds are safe to retry
+            return True
+        return not mutating and self.is_transient(stderr)
+
+    def backoff(self, cmd, attempt, stderr):
+        delay = self.delay(attempt, stderr)
+        if self.is_throttled(stderr):
+            self.bucket.throttled(delay)
+            LOGGER.warning(f"az command throttled, retrying in {delay:.1f}s: {' '.join(cmd)}")
+        else:
+            LOGGER.info(f"az command failed, retrying in {delay:.1f}s: {' '.join(cmd)}")
+            time.sleep(delay)
+
+
+AZ_RETRY = AzRetryPolicy()
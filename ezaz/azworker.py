@@ -0,0 +1,201 @@
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from contextlib import contextmanager
+from contextlib import suppress
+
+from . import AZ_LOGGER
+from .exception import AzWorkerError
+from .exception import AzWorkerUnavailable
+
+
+class AzWorkerProcess:
+    # This provides the same attributes as subprocess.Popen that
+    # AzAction._check_process() uses
+    def __init__(self, args, returncode):
+        self.args = args
+        self.returncode = returncode
+
+
+class AzWorker:
+    def __init__(self, env):
+        env = env | {'PYTHONPATH': os.pathsep.join(p for p in sys.path if p)}
+        try:
+            self.process = subprocess.Popen([sys.executable, '-m', __name__],
+                                            env=env,
+                                            text=True,
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.DEVNULL)
+        except OSError as ose:
+            raise AzWorkerUnavailable(f'Could not start az worker: {ose}') from ose
+
+        try:
+            ready = self._recv()
+        except AzWorkerError as awe:
+            self.close()
+            raise AzWorkerUnavailable(f'az worker failed to start: {awe}') from awe
+        if not ready.get('ready'):
+            self.close()
+            raise AzWorkerUnavailable(f"az worker failed to start: {ready.get('error')}")
+
+    def _send(self, request):
+        try:
+            self.process.stdin.write(json.dumps(request) + '\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError) as e:
+            raise AzWorkerError(f'Could not send request to az worker: {e}') from e
+
+    def _recv(self):
+        line = self.process.stdout.readline()
+        if not line:
+            raise AzWorkerError('az worker exited unexpectedly')
+        try:
+            return json.loads(line)
+        except json.decoder.JSONDecodeError as jde:
+            raise AzWorkerError(f'Invalid response from az worker: {line}') from jde
+
+    def run(self, cmd):
+        assert cmd[0] == 'az'
+        self._send({'args': cmd[1:]})
+        response = self._recv()
+        return (AzWorkerProcess(cmd, response['returncode']), response['stdout'], response['stderr'])
+
+    def close(self):
+        with suppress(OSError, ValueError):
+            self.process.stdin.close()
+        with suppress(subprocess.TimeoutExpired):
+            self.process.wait(timeout=5)
+            return
+        self.process.kill()
+
+
+class AzWorkerPool:
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+        # The az worker runs azure-cli directly, so it can't be used
+        # when replaying recorded az commands
+        self.enabled = not any(v in os.environ for v in ['EZAZ_NO_AZ_WORKER', 'EZAZ_AZ_REPLAY'])
+        self._workers = []
+        self._idle = []
+        self._condition = threading.Condition()
+        atexit.register(self.close)
+
+    def disable(self, reason):
+        if self.enabled:
+            AZ_LOGGER.info(f'Not using az worker: {reason}')
+        self.enabled = False
+        self.close()
+
+    @contextmanager
+    def worker(self, env):
+        with self._condition:
+            while not self._idle and len(self._workers) >= self.max_workers:
+                self._condition.wait()
+            if self._idle:
+                worker = self._idle.pop()
+            else:
+                # Reserve our slot while the (slow) worker startup happens
+                self._workers.append(None)
+                worker = None
+
+        if worker is None:
+            try:
+                worker = AzWorker(env)
+            except AzWorkerUnavailable:
+                with self._condition:
+                    self._workers.remove(None)
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._workers[self._workers.index(None)] = worker
+
+        try:
+            yield worker
+        except AzWorkerError:
+            with self._condition, suppress(ValueError):
+                self._workers.remove(worker)
+                self._condition.notify()
+            worker.close()
+            raise
+        else:
+            with self._condition:
+                self._idle.append(worker)
+                self._condition.notify()
+
+    def run(self, cmd, env):
+        if not self.enabled:
+            raise AzWorkerUnavailable('az worker is disabled')
+        try:
+            with self.worker(env) as worker:
+                return worker.run(cmd)
+        except AzWorkerError as awe:
+            self.disable(str(awe))
+            raise AzWorkerUnavailable(str(awe)) from awe
+
+    def close(self):
+        with self._condition:
+            workers = [w for w in self._workers if w]
+            self._workers = [w for w in self._workers if not w]
+            self._idle = []
+        for worker in workers:
+            worker.close()
+
+
+AZ_WORKERS = AzWorkerPool()
+
+
+def serve():
+    # Our replies go to the original stdout; anything else (e.g. from
+    # azure-cli internals) writing directly to fd 1 goes nowhere
+    reply = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+
+    # Our requests come from the original stdin; any azure-cli prompt
+    # reads from /dev/null instead of our requests
+    requests = os.fdopen(os.dup(sys.stdin.fileno()), 'r')
+    os.dup2(os.open(os.devnull, os.O_RDONLY), sys.stdin.fileno())
+    sys.stdin = open(os.devnull)
+
+    try:
+        from azure.cli.core import get_default_cli
+    except ImportError as ie:
+        reply.write(json.dumps({'ready': False, 'error': str(ie)}) + '\n')
+        return 1
+
+    reply.write(json.dumps({'ready': True}) + '\n')
+    reply.flush()
+
+    import io
+    for line in requests:
+        request = json.loads(line)
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        oldstdout, oldstderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = stdout, stderr
+        try:
+            # Use a new cli instance for each command, so no state
+            # leaks between commands; the (slow) module imports are
+            # what we avoid repeating
+            returncode = get_default_cli().invoke(request['args'], out_file=stdout)
+        except SystemExit as se:
+            returncode = se.code if isinstance(se.code, int) else 1
+        except Exception as e:
+            print(f'ERROR: {e}', file=stderr)
+            returncode = 1
+        finally:
+            sys.stdout, sys.stderr = oldstdout, oldstderr
+        reply.write(json.dumps({'returncode': returncode or 0,
+                                'stdout': stdout.getvalue(),
+                                'stderr': stderr.getvalue()}) + '\n')
+        reply.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(serve())
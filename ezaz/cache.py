@@ -1,20 +1,29 @@
 
 import os
+import threading
 
 from contextlib import contextmanager
 from contextlib import suppress
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
+from functools import partial
 from pathlib import Path
 
 from . import DEFAULT_CACHEPATH
 from . import quote
+from .cachebackend import get_cache_backend
+from .cachedaemon import CACHE_DAEMON
+from .cachecompress import compress
+from .cachecompress import decompress
 from .dictnamespace import DictNamespace
+from .exception import CacheError
 from .exception import CacheExpired
 from .exception import CacheMiss
 from .exception import InvalidCache
 from .exception import InvalidCacheExpiry
+from .exception import InvalidInfo
+from .exception import InvalidInfoVersion
 from .exception import NoCache
 from .timing import TIMESTAMP
 
@@ -22,14 +31,26 @@ from .timing import TIMESTAMP
 DEFAULT_CACHENAME = 'cache'
 DEFAULT_CACHE = DEFAULT_CACHEPATH / DEFAULT_CACHENAME
 TEMPORARY_NO_CACHE = '_temporary_no_cache'
+# Per thread, as cmds run in parallel
+TEMPORARY_NO_CACHE_WRITE = threading.local()
 
 
 class BaseCache:
-    def __init__(self, *, cachepath, parent, expiry, verbose=None, dry_run=None, no_cache_read=None, no_cache_write=None):
+    # How expensive each cachetype is to refetch; when over budget,
+    # cheaper entries are evicted first
+    COSTS = {'absent': 0, 'show': 0, 'id_list': 1, 'list': 2}
+
+    def __init__(self, *, cachepath, parent, expiry, backend=None, daemon=None, refresh=None, verbose=None, dry_run=None, no_cache_read=None, no_cache_write=None):
         self.cachepath = cachepath
         self.parent = parent
         self.expiry = expiry
+        # Called with the cachetype when an expired, but still usable,
+        # entry is read
+        self.refresh = refresh
         self.memcache = parent.memcache if parent else {}
+        self.backend = parent.backend if parent else backend
+        # The cache daemon client, if it's enabled
+        self.daemon = parent.daemon if parent else daemon
         self._verbose = verbose
         self._dry_run = dry_run
         self._no_cache_read = no_cache_read
@@ -52,8 +73,14 @@ class BaseCache:
 
     @property
     def no_cache_write(self):
+        if self.temporary_no_cache_write_active:
+            return True
         return self.parent.no_cache_write if self._no_cache_write is None else self._no_cache_write
 
+    @property
+    def temporary_no_cache_write_active(self):
+        return getattr(TEMPORARY_NO_CACHE_WRITE, 'active', False)
+
     @contextmanager
     def temporary_no_cache(self):
         os.environ[TEMPORARY_NO_CACHE] = 'true'
@@ -63,11 +90,33 @@ class BaseCache:
             with suppress(KeyError):
                 del os.environ[TEMPORARY_NO_CACHE]
 
+    @contextmanager
+    def temporary_no_cache_write(self):
+        # Nothing is written, not even to the memcache
+        active = self.temporary_no_cache_write_active
+        TEMPORARY_NO_CACHE_WRITE.active = True
+        try:
+            yield
+        finally:
+            TEMPORARY_NO_CACHE_WRITE.active = active
+
     @property
     def size(self):
-        return sum([Path(dirpath).joinpath(filename).stat().st_size
-                    for dirpath, dirnames, filenames in os.walk(str(self.cachepath))
-                    for filename in filenames])
+        return self.backend.size(self.cachepath)
+
+    @property
+    def stats(self):
+        return self.backend.stats
+
+    @property
+    def usage(self):
+        # Total usage and budget, of the entire cache
+        return self.backend.usage()
+
+    def set_budget(self, *, max_bytes=None, max_entries=None):
+        if self.dry_run:
+            return
+        self.backend.set_budget(max_bytes=max_bytes, max_entries=max_entries)
 
     def clear(self):
         self.memcache.clear()
@@ -75,69 +124,185 @@ class BaseCache:
         if self.dry_run:
             return
 
-        if self.cachepath.exists():
-            import shutil
-            shutil.rmtree(self.cachepath)
+        self.backend.clear(self.cachepath)
+        if self.daemon:
+            self.daemon.cleared()
+
+    @contextmanager
+    def transaction(self):
+        # Group many writes (and removes) together, if the backend
+        # supports it
+        if self.dry_run or self.no_cache_write:
+            yield
+            return
+        with self.backend.transaction():
+            yield
 
-    def _is_expired(self, *, cachetype, path):
+    def _is_expired(self, *, cachetype, mtime):
         if cachetype == 'show':
-            return self.expiry.is_show_expired(path)
+            return self.expiry.is_show_expired(mtime)
+        if cachetype == 'absent':
+            return self.expiry.is_absent_expired(mtime)
         if cachetype in ['list', 'id_list']:
-            return self.expiry.is_list_expired(path)
+            return self.expiry.is_list_expired(mtime)
         raise RuntimeError(f"Unknown cachetype '{cachetype}'")
 
-    def _read(self, *, cachetype, path):
+    def _is_stale_usable(self, *, cachetype, mtime):
+        if cachetype == 'show':
+            return self.expiry.is_show_stale_usable(mtime)
+        if cachetype == 'absent':
+            return False
+        return self.expiry.is_list_stale_usable(mtime)
+
+    def _read(self, *, cachetype, classname, path, group=None):
         with suppress(KeyError):
             return self.memcache[path]
 
         if self.no_cache_read:
+            self.stats.unusable(classname, cachetype, 'nocache', path)
             raise NoCache()
-        if not path.is_file():
-            raise CacheMiss()
 
         try:
-            if self._is_expired(cachetype=cachetype, path=path):
-                self._remove(cachetype=cachetype, path=path)
-                raise CacheExpired()
-
-            return path.read_text()
+            try:
+                content, mtime = self._backend_read(path, group)
+            except CacheMiss:
+                self.stats.unusable(classname, cachetype, 'miss', path)
+                raise
+
+            if self._is_expired(cachetype=cachetype, mtime=mtime):
+                if not self.refresh or not self._is_stale_usable(cachetype=cachetype, mtime=mtime):
+                    self._remove(cachetype=cachetype, path=path)
+                    self.stats.unusable(classname, cachetype, 'expired', path)
+                    raise CacheExpired()
+                self.refresh(cachetype)
+                self.stats.count(classname, cachetype, 'stale')
+            else:
+                self.stats.count(classname, cachetype, 'hit')
+            self.stats.count(classname, cachetype, 'bytes_read', len(content))
+
+            return content
         finally:
             TIMESTAMP(f'Cache read {cachetype}')
 
-    def _write(self, *, cachetype, path, content):
+    def _backend_read(self, path, group):
+        if self.daemon:
+            # If it's a miss, check the backend too, below
+            with suppress(CacheMiss):
+                result = self.daemon.read(path, group)
+                if result:
+                    return result
+
+        try:
+            return self.backend.read(path, group=group)
+        except CacheMiss:
+            # Another process may be in the middle of updating the cache
+            # (e.g. replacing all the show entries), so if it is, wait
+            # for it to finish and check again
+            with self.backend.shared() as waited:
+                if not waited:
+                    raise
+                return self.backend.read(path, group=group)
+
+    def _read_any_age(self, path):
+        # Returns the entry's content without checking (or removing) it
+        # if it's expired; raises CacheMiss
+        with suppress(KeyError):
+            return self.memcache[path]
+        return self._backend_read(path, None)[0]
+
+    def _read_load(self, *, cachetype, classname, path, load, group=None):
+        # If the content is invalid, it may be from a process that
+        # crashed while writing; wait for any update in progress and
+        # check again, before discarding the entry
+        for retry in (False, True):
+            content = self._read(cachetype=cachetype, classname=classname, path=path, group=group)
+            try:
+                return load(content)
+            except (InvalidInfo, ValueError) as e:
+                self.memcache.pop(path, None)
+                # An entry saved by another ezaz version won't change
+                if retry or isinstance(e, InvalidInfoVersion):
+                    self._remove(cachetype=cachetype, path=path)
+                    self.stats.unusable(classname, cachetype, 'invalid', path)
+                    raise InvalidCache(f'Invalid {cachetype} cache: {e}') from e
+                with self.backend.shared():
+                    pass
+
+    def _write(self, *, cachetype, classname, path, content, group=None):
+        if self.temporary_no_cache_write_active:
+            return
+
         self.memcache[path] = content
 
         if self.dry_run or self.no_cache_write:
             return
 
         try:
-            path.parent.mkdir(parents=True, exist_ok=True)
-            path.write_text(content)
+            data = compress(content)
+            self.backend.write(path, data, cost=self.COSTS[cachetype], group=group)
+            if self.daemon:
+                self.daemon.changed(path)
+            self.stats.written(classname, cachetype, path, len(data))
         finally:
             TIMESTAMP(f'Cache write {cachetype}')
 
+    def _update(self, *, cachetype, classname, path, update):
+        # Replaces an existing entry's content with update(content),
+        # keeping its mtime, so it expires when it would have; if
+        # update() raises InvalidInfo or ValueError, the entry is removed
+        self.memcache.pop(path, None)
+
+        if self.dry_run or self.no_cache_write:
+            return
+
+        try:
+            with self.transaction():
+                try:
+                    content, mtime = self.backend.read(path)
+                except CacheMiss:
+                    return
+                try:
+                    content = update(decompress(content))
+                except (InvalidInfo, ValueError):
+                    self._remove(cachetype=cachetype, path=path)
+                    return
+                data = compress(content)
+                self.backend.write(path, data, cost=self.COSTS[cachetype], mtime=mtime)
+                if self.daemon:
+                    self.daemon.changed(path)
+                self.stats.count(classname, cachetype, 'bytes_written', len(data))
+        finally:
+            TIMESTAMP(f'Cache update {cachetype}')
+
     def _remove(self, *, cachetype, path):
         self.memcache.pop(path, None)
 
         if self.dry_run:
             return
 
-        path.unlink(missing_ok=True)
+        self.backend.remove(path)
+        if self.daemon:
+            self.daemon.changed(path)
 
-    def _remove_all(self, *, cachetype, path):
-        parent_dir = path.parent
+    def _remove_all(self, *, cachetype, group):
+        # All entries written with this group become obsolete; the
+        # backend doesn't need to find (or remove) them
+        parent_dir = group.parent
         try:
             parent_dir.relative_to(self.cachepath)
         except ValueError:
             raise CacheError(f"Cannot remove cache files in '{parent_dir}' which is outside cache path '{self.cachepath}'")
 
-        if not parent_dir.is_dir():
+        prefix = group.name + '_'
+        for p in [p for p in self.memcache if p.parent == parent_dir and p.name.startswith(prefix)]:
+            self.memcache.pop(p, None)
+
+        if self.dry_run:
             return
 
-        name = path.name
-        for f in parent_dir.iterdir():
-            if f.name.startswith(name):
-                self._remove(cachetype=cachetype, path=f)
+        self.backend.invalidate(group)
+        if self.daemon:
+            self.daemon.invalidated()
 
     def __file(self, *args):
         return self.cachepath / '_'.join(args)
@@ -150,28 +315,61 @@ class ShowCache(BaseCache):
     def showfile(self, *, classname, objid):
         return self._file(cachetype='show', classname=classname, objid=objid)
 
-    def read_show(self, *, classname, objid):
-        return self._read(cachetype='show', path=self.showfile(classname=classname, objid=objid))
+    def showgroup(self, *, classname):
+        # All the show entries of the class
+        return self._file(cachetype='show', classname=classname)
+
+    def read_show(self, *, classname, objid, load=None):
+        path = self.showfile(classname=classname, objid=objid)
+        group = self.showgroup(classname=classname)
+        if load:
+            return self._read_load(cachetype='show', classname=classname, path=path, load=load, group=group)
+        return self._read(cachetype='show', classname=classname, path=path, group=group)
 
     def write_show(self, *, classname, objid, content):
-        self._write(cachetype='show', path=self.showfile(classname=classname, objid=objid), content=content)
+        self._write(cachetype='show', classname=classname, path=self.showfile(classname=classname, objid=objid), content=content,
+                    group=self.showgroup(classname=classname))
 
     def invalidate_show(self, *, classname, objid):
         self._remove(cachetype='show', path=self.showfile(classname=classname, objid=objid))
 
     def invalidate_show_all(self, *, classname):
-        self._remove_all(cachetype='show', path=self.showfile(classname=classname, objid=None))
+        # This includes the absent entries
+        self._remove_all(cachetype='show', group=self.showgroup(classname=classname))
+
+    # An absent entry records that the object doesn't exist; these are
+    # in the show group, so a list write invalidates them
+    def absentfile(self, *, classname, objid):
+        return self._file(cachetype='absent', classname=classname, objid=objid)
+
+    def read_absent(self, *, classname, objid):
+        # Raises CacheError unless the object is known to not exist
+        self._read(cachetype='absent', classname=classname, path=self.absentfile(classname=classname, objid=objid),
+                   group=self.showgroup(classname=classname))
+
+    def write_absent(self, *, classname, objid):
+        self._write(cachetype='absent', classname=classname, path=self.absentfile(classname=classname, objid=objid), content='',
+                    group=self.showgroup(classname=classname))
+
+    def invalidate_absent(self, *, classname, objid):
+        self._remove(cachetype='absent', path=self.absentfile(classname=classname, objid=objid))
 
 
 class ListCache(BaseCache):
     def listfile(self, *, tag=None, classname):
         return self._file(cachetype='list', tag=tag, classname=classname)
 
-    def read_list(self, *, tag=None, classname):
-        return self._read(cachetype='list', path=self.listfile(tag=tag, classname=classname))
+    def read_list(self, *, tag=None, classname, load=None):
+        path = self.listfile(tag=tag, classname=classname)
+        if load:
+            return self._read_load(cachetype='list', classname=classname, path=path, load=load)
+        return self._read(cachetype='list', classname=classname, path=path)
 
     def write_list(self, *, tag=None, classname, content):
-        self._write(cachetype='list', path=self.listfile(tag=tag, classname=classname), content=content)
+        self._write(cachetype='list', classname=classname, path=self.listfile(tag=tag, classname=classname), content=content)
+
+    def update_list(self, *, tag=None, classname, update):
+        self._update(cachetype='list', classname=classname, path=self.listfile(tag=tag, classname=classname), update=update)
 
     def invalidate_list(self, *, tag=None, classname):
         self._remove(cachetype='list', path=self.listfile(tag=tag, classname=classname))
@@ -183,32 +381,71 @@ class IdListCache(BaseCache):
 
     def read_id_list(self, *, tag=None, classname):
         import json
-        try:
-            return json.loads(self._read(cachetype='id_list', path=self.idlistfile(tag=tag, classname=classname)))
-        except json.decoder.JSONDecodeError as je:
-            raise InvalidCache(f'Invalid id list cache: {je}') from je
+        return self._read_load(cachetype='id_list', classname=classname, path=self.idlistfile(tag=tag, classname=classname),
+                               load=lambda c: json.loads(decompress(c)))
 
     def write_id_list(self, *, tag=None, classname, idlist):
         import json
         try:
-            self._write(cachetype='id_list', path=self.idlistfile(tag=tag, classname=classname), content=json.dumps(idlist))
+            self._write(cachetype='id_list', classname=classname, path=self.idlistfile(tag=tag, classname=classname), content=json.dumps(idlist))
         except TypeError as te:
             raise InvalidCache(f'Invalid id list cache: {te}') from te
 
+    def update_id_list(self, *, tag=None, classname, add=(), remove=()):
+        import json
+
+        def update(content):
+            idlist = [i for i in json.loads(content) if i not in remove]
+            return json.dumps(idlist + [i for i in add if i not in idlist])
+
+        self._update(cachetype='id_list', classname=classname, path=self.idlistfile(tag=tag, classname=classname), update=update)
+
     def invalidate_id_list(self, *, tag=None, classname):
         self._remove(cachetype='id_list', path=self.idlistfile(tag=tag, classname=classname))
 
 
 class InfoCache(ShowCache, ListCache):
-    def read_info(self, **kwargs):
+    # A show entry written with its list is a reference to the info in
+    # the list entry, so each info is only saved once
+    REF_HEADER = 'ezaz-ref'
+
+    def read_info(self, *, classname, **kwargs):
+        return self.read_show(classname=classname, load=partial(self._load_info, classname=classname), **kwargs)
+
+    @classmethod
+    def parse_ref(cls, content):
+        # Returns (list entry name, objid) if the (decompressed) show
+        # content is a reference, otherwise None
+        if not content.startswith(cls.REF_HEADER + ' '):
+            return None
+        header, _, objid = content.partition('\n')
+        return (header[len(cls.REF_HEADER) + 1:], objid)
+
+    def _load_info(self, content, *, classname):
         from .azobject.info import Info
-        return Info.load(self.read_show(**kwargs), verbose=self.verbose)
+        content = decompress(content)
+        ref = self.parse_ref(content)
+        if not ref:
+            return Info.load(content, verbose=self.verbose)
+        listname, objid = ref
+        listfile = self.cachepath / listname
+        # The show entry's own age (and the show expiry) decide if it's
+        # expired, not the list's; if the list is gone, it's a miss
+        info = Info.load_list_info(self._read_any_age(listfile), objid, verbose=self.verbose)
+        if info is None:
+            # It was removed from the list, after the reference was written
+            raise CacheMiss()
+        return info
 
     def write_info(self, *, info, **kwargs):
         from .azobject.info import Info
         assert isinstance(info, Info)
         self.write_show(content=info.save(), **kwargs)
 
+    def write_info_ref(self, *, classname, objid, tag=None):
+        listfile = self.listfile(tag=tag, classname=classname)
+        self.write_show(classname=classname, objid=objid, content=f'{self.REF_HEADER} {listfile.name}\n{objid}')
+
     def invalidate_info(self, *, objid, **kwargs):
         self.invalidate_show(objid=objid, **kwargs)
 
@@ -217,12 +454,25 @@ class InfoCache(ShowCache, ListCache):
 
     def read_info_list(self, **kwargs):
         from .azobject.info import Info
-        return Info.load_list(self.read_list(**kwargs), verbose=self.verbose)
+        return self.read_list(load=partial(Info.load_list, verbose=self.verbose), **kwargs)
 
     def write_info_list(self, *, infolist, **kwargs):
         from .azobject.info import Info
         self.write_list(content=Info.save_list(infolist), **kwargs)
 
+    def update_info_list(self, *, add=(), remove=(), **kwargs):
+        # Adds (or replaces) the add infos, and removes the remove ids
+        from .azobject.info import Info
+
+        def update(content):
+            infos = {info._id: info for info in Info.load_list(content, verbose=self.verbose) if info._id not in remove}
+            infos |= {info._id: info for info in add}
+            if len({type(info) for info in infos.values()}) > 1:
+                raise InvalidInfo('Info list classes do not match')
+            return Info.save_list(list(infos.values()))
+
+        self.update_list(update=update, **kwargs)
+
     def invalidate_info_list(self, **kwargs):
         self.invalidate_list(**kwargs)
 
@@ -242,6 +492,9 @@ class ShowClassCache(BaseClassCache, ShowCache):
     def showfile(self, *, classname=None, **kwargs):
         return super().showfile(classname=classname or self.classname, **kwargs)
 
+    def showgroup(self, *, classname=None):
+        return super().showgroup(classname=classname or self.classname)
+
     def read_show(self, *, classname=None, **kwargs):
         return super().read_show(classname=classname or self.classname, **kwargs)
 
@@ -254,6 +507,18 @@ class ShowClassCache(BaseClassCache, ShowCache):
     def invalidate_show_all(self, *, classname=None, **kwargs):
         super().invalidate_show_all(classname=classname or self.classname, **kwargs)
 
+    def absentfile(self, *, classname=None, **kwargs):
+        return super().absentfile(classname=classname or self.classname, **kwargs)
+
+    def read_absent(self, *, classname=None, **kwargs):
+        super().read_absent(classname=classname or self.classname, **kwargs)
+
+    def write_absent(self, *, classname=None, **kwargs):
+        super().write_absent(classname=classname or self.classname, **kwargs)
+
+    def invalidate_absent(self, *, classname=None, **kwargs):
+        super().invalidate_absent(classname=classname or self.classname, **kwargs)
+
 
 class ListClassCache(BaseClassCache, ListCache):
     def listfile(self, *, classname=None, **kwargs):
@@ -265,6 +530,9 @@ class ListClassCache(BaseClassCache, ListCache):
     def write_list(self, *, classname=None, **kwargs):
         super().write_list(classname=classname or self.classname, **kwargs)
 
+    def update_list(self, *, classname=None, **kwargs):
+        super().update_list(classname=classname or self.classname, **kwargs)
+
     def invalidate_list(self, *, classname=None, **kwargs):
         super().invalidate_list(classname=classname or self.classname, **kwargs)
 
@@ -279,6 +547,9 @@ class IdListClassCache(BaseClassCache, IdListCache):
     def write_id_list(self, *, classname=None, **kwargs):
         super().write_id_list(classname=classname or self.classname, **kwargs)
 
+    def update_id_list(self, *, classname=None, **kwargs):
+        super().update_id_list(classname=classname or self.classname, **kwargs)
+
     def invalidate_id_list(self, *, classname=None, **kwargs):
         super().invalidate_id_list(classname=classname or self.classname, **kwargs)
 
@@ -290,6 +561,9 @@ class InfoClassCache(BaseClassCache, InfoCache):
     def write_info(self, *, classname=None, **kwargs):
         super().write_info(classname=classname or self.classname, **kwargs)
 
+    def write_info_ref(self, *, classname=None, **kwargs):
+        super().write_info_ref(classname=classname or self.classname, **kwargs)
+
     def invalidate_info(self, *, classname=None, **kwargs):
         super().invalidate_info(classname=classname or self.classname, **kwargs)
 
@@ -302,6 +576,9 @@ class InfoClassCache(BaseClassCache, InfoCache):
     def write_info_list(self, *, classname=None, **kwargs):
         super().write_info_list(classname=classname or self.classname, **kwargs)
 
+    def update_info_list(self, *, classname=None, **kwargs):
+        super().update_info_list(classname=classname or self.classname, **kwargs)
+
     def invalidate_info_list(self, *, classname=None, **kwargs):
         super().invalidate_info_list(classname=classname or self.classname, **kwargs)
 
@@ -335,6 +612,18 @@ class ShowObjectCache(BaseObjectCache, ShowClassCache):
     def invalidate_show(self, *, objid=None, **kwargs):
         super().invalidate_show(objid=objid or self.objid, **kwargs)
 
+    def absentfile(self, *, objid=None, **kwargs):
+        return super().absentfile(objid=objid or self.objid, **kwargs)
+
+    def read_absent(self, *, objid=None, **kwargs):
+        super().read_absent(objid=objid or self.objid, **kwargs)
+
+    def write_absent(self, *, objid=None, **kwargs):
+        super().write_absent(objid=objid or self.objid, **kwargs)
+
+    def invalidate_absent(self, *, objid=None, **kwargs):
+        super().invalidate_absent(objid=objid or self.objid, **kwargs)
+
 
 class ListObjectCache(BaseObjectCache, ListClassCache):
     pass
@@ -351,6 +640,9 @@ class InfoObjectCache(BaseObjectCache, InfoClassCache):
     def write_info(self, *, objid=None, **kwargs):
         super().write_info(objid=objid or self.objid, **kwargs)
 
+    def write_info_ref(self, *, objid=None, **kwargs):
+        super().write_info_ref(objid=objid or self.objid, **kwargs)
+
     def invalidate_info(self, *, objid=None, **kwargs):
         super().invalidate_info(objid=objid or self.objid, **kwargs)
 
@@ -361,11 +653,11 @@ class ParentObjectCache(BaseObjectCache, ParentClassCache):
         # meaning all children share their parent's cache
         return super()._child_cache_dir(classname=classname, objid=objid or self.objid)
 
-    def child_class_cache(self, expiry, child_classname):
-        return ClassCache(cachepath=self._child_cache_dir(), parent=self, expiry=expiry, classname=child_classname)
+    def child_class_cache(self, expiry, child_classname, refresh=None):
+        return ClassCache(cachepath=self._child_cache_dir(), parent=self, expiry=expiry, classname=child_classname, refresh=refresh)
 
-    def child_object_cache(self, expiry, child_classname, child_objid):
-        return ObjectCache(cachepath=self._child_cache_dir(), parent=self, expiry=expiry, classname=child_classname, objid=child_objid)
+    def child_object_cache(self, expiry, child_classname, child_objid, refresh=None):
+        return ObjectCache(cachepath=self._child_cache_dir(), parent=self, expiry=expiry, classname=child_classname, objid=child_objid, refresh=refresh)
 
 
 class ObjectCache(ParentObjectCache, ShowObjectCache, ListObjectCache, IdListObjectCache, InfoObjectCache):
@@ -373,29 +665,37 @@ class ObjectCache(ParentObjectCache, ShowObjectCache, ListObjectCache, IdListObj
 
 
 class Cache:
-    def __init__(self, *, cachepath, verbose, dry_run, no_cache_read, no_cache_write):
+    def __init__(self, *, cachepath, verbose, dry_run, no_cache_read, no_cache_write, backend=None):
         self.cachepath = Path(cachepath or DEFAULT_CACHE).expanduser().resolve()
+        self.backend = get_cache_backend(backend, self.cachepath)
+        self.daemon = CACHE_DAEMON.client(self.backend)
         self.verbose = verbose
         self.dry_run = dry_run
         self.no_cache_read = no_cache_read
         self.no_cache_write = no_cache_write
 
-    def class_cache(self, expiry, classname):
+    def class_cache(self, expiry, classname, refresh=None):
         return ClassCache(cachepath=self.cachepath,
                           parent=None,
                           expiry=expiry,
                           classname=classname,
+                          backend=self.backend,
+                          daemon=self.daemon,
+                          refresh=refresh,
                           verbose=self.verbose,
                           dry_run=self.dry_run,
                           no_cache_read=self.no_cache_read,
                           no_cache_write=self.no_cache_write)
 
-    def object_cache(self, expiry, classname, objid):
+    def object_cache(self, expiry, classname, objid, refresh=None):
         return ObjectCache(cachepath=self.cachepath,
                            parent=None,
                            expiry=expiry,
                            classname=classname,
                            objid=objid,
+                           backend=self.backend,
+                           daemon=self.daemon,
+                           refresh=refresh,
                            verbose=self.verbose,
                            dry_run=self.dry_run,
                            no_cache_read=self.no_cache_read,
@@ -406,34 +706,70 @@ class CacheExpiry(DictNamespace):
     NOCACHE = 'nocache'
     FOREVER = 'forever'
     DEFAULT = NOCACHE
+    # Objects that don't exist are only remembered briefly
+    DEFAULT_ABSENT_EXPIRY = 60
+    FIELDS = ('show_expiry', 'list_expiry', 'stale_expiry', 'absent_expiry')
 
-    def __init__(self, config, *, show_expiry=None, list_expiry=None):
+    def __init__(self, config, *, show_expiry=None, list_expiry=None, stale_expiry=None, absent_expiry=None):
         super().__init__(config)
 
         self.show_expiry = show_expiry or getattr(self, 'show_expiry', None)
         self.list_expiry = list_expiry or getattr(self, 'list_expiry', None)
+        # How long after expiring an entry may still be used, while it
+        # is refreshed in the background
+        self.stale_expiry = stale_expiry or getattr(self, 'stale_expiry', None)
+        # How long to remember that an object doesn't exist
+        self.absent_expiry = absent_expiry or getattr(self, 'absent_expiry', None)
 
     def __bool__(self):
-        return bool(self.show_expiry or self.list_expiry)
+        return any(getattr(self, field) for field in self.FIELDS)
 
-    def is_show_expired(self, entry):
-        return self.is_expired(entry, self.show_expiry)
+    def merged(self, parent):
+        # Any field we don't configure comes from the parent's config
+        return CacheExpiry({}, **{field: getattr(self, field) or getattr(parent, field) for field in self.FIELDS})
 
-    def is_list_expired(self, entry):
-        return self.is_expired(entry, self.list_expiry)
+    def is_show_expired(self, mtime):
+        return self.is_expired(mtime, self.show_expiry)
 
-    def is_expired(self, entry, expiry):
+    def is_list_expired(self, mtime):
+        return self.is_expired(mtime, self.list_expiry)
+
+    def is_absent_expired(self, mtime):
+        # Never longer than the show info is cached
+        if self.is_show_expired(mtime):
+            return True
+        return self.is_expired(mtime, self.absent_expiry or self.DEFAULT_ABSENT_EXPIRY)
+
+    def is_show_stale_usable(self, mtime):
+        return self.is_stale_usable(mtime, self.show_expiry)
+
+    def is_list_stale_usable(self, mtime):
+        return self.is_stale_usable(mtime, self.list_expiry)
+
+    def is_expired(self, mtime, expiry):
         if expiry is None:
             expiry = self.DEFAULT
         if expiry == self.FOREVER:
             return False
         if expiry == self.NOCACHE:
             return True
+        return self.age(mtime) > self.duration(expiry)
+
+    def is_stale_usable(self, mtime, expiry):
+        # Never for entries that shouldn't be cached at all
+        if self.stale_expiry is None or expiry in (None, self.NOCACHE):
+            return False
+        if self.stale_expiry == self.FOREVER:
+            return True
+        if self.stale_expiry == self.NOCACHE:
+            return False
+        return self.age(mtime) <= self.duration(expiry) + self.duration(self.stale_expiry)
+
+    def duration(self, expiry):
         try:
-            duration = timedelta(seconds=int(float(expiry)))
+            return timedelta(seconds=int(float(expiry)))
         except ValueError as ve:
             raise InvalidCacheExpiry(f"Invalid expiration duration '{expiry}': {ve}") from ve
-        return self.age(entry) > duration
 
-    def age(self, entry):
-        return datetime.now(tz=timezone.utc) - datetime.fromtimestamp(entry.stat().st_mtime, tz=timezone.utc)
+    def age(self, mtime):
+        return datetime.now(tz=timezone.utc) - datetime.fromtimestamp(mtime, tz=timezone.utc)
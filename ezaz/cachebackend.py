@@ -0,0 +1,644 @@
+
+import atexit
+import fcntl
+import os
+import threading
+import time
+
+from abc import ABC
+from abc import abstractmethod
+from contextlib import contextmanager
+from contextlib import suppress
+from functools import cache
+from functools import cached_property
+from pathlib import Path
+from types import SimpleNamespace
+
+from . import LOGGER
+from .exception import CacheMiss
+from .exception import InvalidCache
+
+
+DEFAULT_CACHE_BACKEND = 'file'
+
+
+class SqliteDb:
+    # A sqlite database (in WAL mode), shared by all threads
+    def __init__(self, path, schema=''):
+        self.path = path
+        self.schema = schema
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            import sqlite3
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(self.schema)
+            self._db = db
+        return self._db
+
+    @property
+    def user_version(self):
+        return self.execute('PRAGMA user_version')[0][0]
+
+    @user_version.setter
+    def user_version(self, version):
+        self.execute(f'PRAGMA user_version = {int(version)}')
+
+    def has_table(self, name):
+        return bool(self.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)))
+
+    def columns(self, table):
+        return [row[1] for row in self.execute(f'PRAGMA table_info({table})')]
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def executemany(self, sql, params):
+        with self._lock:
+            self.db.executemany(sql, params)
+
+    def executescript(self, sql):
+        with self._lock:
+            self.db.executescript(sql)
+
+    @contextmanager
+    def transaction(self):
+        # All writes in the transaction are committed together; other
+        # threads wait until it's done
+        with self._lock:
+            if self._depth == 0:
+                self.db.execute('BEGIN IMMEDIATE')
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.db.execute('ROLLBACK')
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.db.execute('COMMIT')
+
+
+class CacheIndex:
+    # The size, last access time, and refetch cost of every cache
+    # entry, with the totals (and the budget) kept in the meta table,
+    # so the cache usage is known without scanning the entries.
+    # Entries may belong to a group (e.g. all the show entries of a
+    # class), which is invalidated by incrementing its generation; an
+    # entry written in an older generation is obsolete, and is left
+    # for eviction (or replacement) instead of being removed right away.
+    # The write time (mtime), generation, and version of the entries
+    # in a dir are read together, the first time an entry in the dir
+    # is read, so reads (and expiry checks) don't need to query the
+    # index (or stat the entry)
+    # Each statement is run separately, in one transaction
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS entry_index (
+            path TEXT PRIMARY KEY, size INTEGER NOT NULL, atime REAL NOT NULL, cost INTEGER NOT NULL,
+            generation INTEGER NOT NULL DEFAULT 0, mtime REAL, version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID''',
+        'CREATE TABLE IF NOT EXISTS generations (grp TEXT PRIMARY KEY, generation INTEGER NOT NULL) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value) WITHOUT ROWID',
+        '''CREATE TABLE IF NOT EXISTS stats (
+            classname TEXT NOT NULL, cachetype TEXT NOT NULL, event TEXT NOT NULL, value NOT NULL,
+            PRIMARY KEY (classname, cachetype, event)
+        ) WITHOUT ROWID''',
+        "INSERT OR IGNORE INTO meta (key, value) VALUES ('bytes', 0), ('entries', 0), ('version', 0)",
+        '''CREATE TRIGGER IF NOT EXISTS entry_index_insert AFTER INSERT ON entry_index BEGIN
+            UPDATE meta SET value = value + NEW.size WHERE key = 'bytes';
+            UPDATE meta SET value = value + 1 WHERE key = 'entries';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS entry_index_update AFTER UPDATE OF size ON entry_index BEGIN
+            UPDATE meta SET value = value - OLD.size + NEW.size WHERE key = 'bytes';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS entry_index_delete AFTER DELETE ON entry_index BEGIN
+            UPDATE meta SET value = value - OLD.size WHERE key = 'bytes';
+            UPDATE meta SET value = value - 1 WHERE key = 'entries';
+        END''',
+    )
+    # Stored as the database's user_version once the schema is created
+    # (or upgraded), so it's only (re)created when out of date, and
+    # readers never need the write lock
+    SCHEMA_VERSION = 2
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    DEFAULT_MAX_ENTRIES = 0
+    # Each point of cost counts as this many seconds more recently
+    # used, when choosing which entries to evict
+    COST_AGE = 24 * 60 * 60
+    # Columns added since the entry_index table was first created
+    ADDED_COLUMNS = {'generation': 'INTEGER NOT NULL DEFAULT 0', 'mtime': 'REAL', 'version': 'INTEGER NOT NULL DEFAULT 0'}
+    # Reread a dir's entries after this many seconds, in case another
+    # process changed them
+    SNAPSHOT_SECONDS = 10
+
+    def __init__(self, sqlitedb, rescan=None):
+        self.sqlitedb = sqlitedb
+        self.rescan = rescan
+        self._ready = False
+        self._touched = {}
+        self._touched_lock = threading.Lock()
+        self._snapshots = {}
+        self._generations = None
+
+    @property
+    def db(self):
+        if not self._ready:
+            self._ready = True
+            try:
+                if self.sqlitedb.user_version < self.SCHEMA_VERSION:
+                    self._create()
+            except BaseException:
+                self._ready = False
+                raise
+        return self.sqlitedb
+
+    def _create(self):
+        with self.sqlitedb.transaction():
+            # Another process may have done it while we waited for the lock
+            if self.sqlitedb.user_version >= self.SCHEMA_VERSION:
+                return
+            created = not self.sqlitedb.has_table('entry_index')
+            if not created:
+                columns = self.sqlitedb.columns('entry_index')
+                for column, definition in self.ADDED_COLUMNS.items():
+                    if column not in columns:
+                        self.sqlitedb.execute(f'ALTER TABLE entry_index ADD COLUMN {column} {definition}')
+            for statement in self.SCHEMA:
+                self.sqlitedb.execute(statement)
+            self.sqlitedb.user_version = self.SCHEMA_VERSION
+            if created and self.rescan:
+                self.rescan()
+
+    def add(self, key, size, cost, atime=None, group=None, mtime=None):
+        # Each write (or update, which keeps the mtime) gives the entry
+        # a new version, from a counter shared by all entries, so an
+        # entry that's removed and written again doesn't reuse one
+        now = time.time()
+        with self.db.transaction():
+            self.db.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            self.db.execute('INSERT INTO entry_index (path, size, atime, cost, generation, mtime, version) '
+                            'VALUES (?, ?, ?, ?, IFNULL((SELECT generation FROM generations WHERE grp = ?), 0), ?, '
+                            "(SELECT value FROM meta WHERE key = 'version')) "
+                            'ON CONFLICT (path) DO UPDATE SET size = excluded.size, atime = excluded.atime, '
+                            'cost = excluded.cost, generation = excluded.generation, mtime = excluded.mtime, '
+                            'version = excluded.version',
+                            (key, size, atime or now, cost, group, mtime or now))
+        self.forget(key)
+
+    def invalidate(self, group):
+        self.db.execute('INSERT INTO generations (grp, generation) VALUES (?, 1) '
+                        'ON CONFLICT (grp) DO UPDATE SET generation = generation + 1', (group,))
+        self.forget(generations=True)
+
+    def _dirname(self, key):
+        return key.rpartition('/')[0]
+
+    def forget(self, key=None, generations=False):
+        # Drops the snapshot of the key's dir (or, with no key, all the
+        # snapshots), so it's reread when next used
+        if key is None:
+            self._snapshots.clear()
+            generations = True
+        else:
+            self._snapshots.pop(self._dirname(key), None)
+        if generations:
+            self._generations = None
+
+    def lookup(self, key):
+        # Returns the entry's (mtime, generation, version), or None if
+        # it isn't indexed; the mtime may be None, if it was indexed
+        # before mtimes were
+        dirname = self._dirname(key)
+        snapshot = self._snapshots.get(dirname)
+        if not snapshot or time.monotonic() > snapshot[0] + self.SNAPSHOT_SECONDS:
+            lo = dirname + '/' if dirname else ''
+            # Only the entries directly in the dir
+            rows = self.db.execute('SELECT path, mtime, generation, version FROM entry_index '
+                                   "WHERE path >= ? AND path < ? AND instr(substr(path, ?), '/') = 0",
+                                   (lo, lo + '\U0010ffff', len(lo) + 1))
+            snapshot = (time.monotonic(), {path: (mtime, generation, version) for path, mtime, generation, version in rows})
+            self._snapshots[dirname] = snapshot
+        return snapshot[1].get(key)
+
+    def generation(self, group):
+        generations = self._generations
+        if not generations or time.monotonic() > generations[0] + self.SNAPSHOT_SECONDS:
+            generations = (time.monotonic(), dict(self.db.execute('SELECT grp, generation FROM generations')))
+            self._generations = generations
+        return generations[1].get(group, 0)
+
+    def is_obsolete(self, key, group):
+        entry = self.lookup(key)
+        return bool(entry) and entry[1] < self.generation(group)
+
+    def touch(self, key):
+        # Access times are only saved at exit, so reads stay cheap
+        with self._touched_lock:
+            if not self._touched:
+                atexit.register(self.flush)
+            self._touched[key] = time.time()
+
+    def flush(self):
+        with self._touched_lock:
+            touched = list(self._touched.items())
+            self._touched.clear()
+        if touched:
+            with self.db.transaction():
+                self.db.executemany('UPDATE entry_index SET atime = ? WHERE path = ?',
+                                    [(atime, key) for key, atime in touched])
+
+    def remove(self, *keys):
+        self.db.executemany('DELETE FROM entry_index WHERE path = ?', [(key,) for key in keys])
+        for key in keys:
+            self.forget(key)
+
+    def remove_range(self, lo, hi):
+        self.db.execute('DELETE FROM entry_index WHERE path >= ? AND path < ?', (lo, hi))
+        self.db.execute('DELETE FROM generations WHERE grp >= ? AND grp < ?', (lo, hi))
+        self.forget()
+
+    def size(self, lo, hi):
+        return self.db.execute('SELECT SUM(size) FROM entry_index WHERE path >= ? AND path < ?', (lo, hi))[0][0] or 0
+
+    def entries(self, lo, hi):
+        return self.db.execute('SELECT path, cost FROM entry_index WHERE path >= ? AND path < ? ORDER BY path', (lo, hi))
+
+    def usage(self):
+        meta = dict(self.db.execute('SELECT key, value FROM meta'))
+        return SimpleNamespace(bytes=meta.get('bytes', 0),
+                               entries=meta.get('entries', 0),
+                               max_bytes=meta.get('max_bytes', self.DEFAULT_MAX_BYTES),
+                               max_entries=meta.get('max_entries', self.DEFAULT_MAX_ENTRIES))
+
+    def set_budget(self, *, max_bytes=None, max_entries=None):
+        # A budget of 0 is unlimited
+        for key, value in (('max_bytes', max_bytes), ('max_entries', max_entries)):
+            if value is not None:
+                self.db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def add_stats(self, counts):
+        with self.db.transaction():
+            self.db.executemany('INSERT INTO stats (classname, cachetype, event, value) VALUES (?, ?, ?, ?) '
+                                'ON CONFLICT (classname, cachetype, event) DO UPDATE SET value = value + excluded.value',
+                                counts)
+
+    def stats(self):
+        return self.db.execute('SELECT classname, cachetype, event, value FROM stats')
+
+    def clear_stats(self):
+        self.db.execute('DELETE FROM stats')
+
+    def victims(self):
+        # The least recently used entries first, with expensive entries
+        # kept longer than cheap ones
+        return self.db.execute('SELECT path, size FROM entry_index ORDER BY atime + cost * ?', (self.COST_AGE,))
+
+
+class CacheBackend(ABC):
+    # Stores the cache entries, using each entry's file path (under
+    # the cache root) as its key. All entries are tracked in the index,
+    # which is used to keep the cache within its budget.
+    # When over budget, evict down to this fraction of the budget
+    EVICT_TO = 0.9
+
+    def __init__(self, root):
+        self.root = root
+        self._tdepth = 0
+
+    @property
+    @abstractmethod
+    def index(self):
+        pass
+
+    @cached_property
+    def stats(self):
+        from .cachestats import CacheStats
+        return CacheStats(self.index)
+
+    def _key(self, path):
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError as ve:
+            raise InvalidCache(f"Cache path '{path}' is outside cache root '{self.root}'") from ve
+
+    def _dir_prefix(self, path):
+        key = self._key(path)
+        return '' if key == '.' else key + '/'
+
+    def _range(self, prefix):
+        return (prefix, prefix + '\U0010ffff')
+
+    def read(self, path, group=None):
+        # Returns (content, mtime), or raises CacheMiss (also if the
+        # entry is obsolete); the content may be bytes (see
+        # cachecompress.decompress())
+        result = self._read(path)
+        key = self._key(path)
+        if group and self.index.is_obsolete(key, self._key(group)):
+            raise CacheMiss()
+        self.index.touch(key)
+        return result
+
+    def write(self, path, content, cost=0, group=None, mtime=None):
+        # The mtime defaults to now; the entry and index get the same one
+        mtime = mtime or time.time()
+        with self.transaction():
+            self._write(path, content, mtime)
+            self.index.add(self._key(path), len(content if isinstance(content, bytes) else content.encode()), cost,
+                           group=self._key(group) if group else None, mtime=mtime)
+
+    def remove(self, path):
+        with self.transaction():
+            self._remove(path)
+            self.index.remove(self._key(path))
+
+    def invalidate(self, group):
+        # Makes all entries currently in the group obsolete
+        with self.transaction():
+            self.index.invalidate(self._key(group))
+
+    def entries(self, path):
+        # Returns [(path, cost)] of all entries under the path dir
+        return [(self.root / key, cost) for key, cost in self.index.entries(*self._range(self._dir_prefix(path)))]
+
+    def size(self, path):
+        # Total size of all entries under the path dir
+        if path == self.root:
+            return self.index.usage().bytes
+        return self.index.size(*self._range(self._dir_prefix(path)))
+
+    def clear(self, path):
+        # Removes all entries under the path dir
+        with self.transaction():
+            self._clear(path)
+            self.index.remove_range(*self._range(self._dir_prefix(path)))
+
+    def usage(self):
+        return self.index.usage()
+
+    def set_budget(self, **kwargs):
+        with self.transaction():
+            self.index.set_budget(**kwargs)
+
+    def evict(self):
+        usage = self.index.usage()
+        over_bytes = usage.bytes - usage.max_bytes * self.EVICT_TO if usage.max_bytes and usage.bytes > usage.max_bytes else 0
+        over_entries = usage.entries - usage.max_entries * self.EVICT_TO if usage.max_entries and usage.entries > usage.max_entries else 0
+        if over_bytes <= 0 and over_entries <= 0:
+            return
+
+        # Make sure our own recent reads count
+        self.index.flush()
+        keys = []
+        for key, size in self.index.victims():
+            if over_bytes <= 0 and over_entries <= 0:
+                break
+            keys.append(key)
+            over_bytes -= size
+            over_entries -= 1
+        for key in keys:
+            self._remove(self.root / key)
+        self.index.remove(*keys)
+        LOGGER.debug(f'Evicted {len(keys)} cache entries')
+
+    @contextmanager
+    def transaction(self):
+        # Entries are evicted (if over budget) at the end of the
+        # outermost transaction
+        with self._transaction():
+            self._tdepth += 1
+            try:
+                yield
+                if self._tdepth == 1:
+                    self.evict()
+            finally:
+                self._tdepth -= 1
+
+    def flush(self):
+        # Saves the stats and access times now, instead of at exit
+        if 'stats' in self.__dict__:
+            self.stats.flush()
+        self.index.flush()
+
+    @contextmanager
+    def shared(self):
+        # Waits for any transaction (in any process) to finish; yields
+        # True if it had to wait
+        yield False
+
+    @abstractmethod
+    def _read(self, path):
+        pass
+
+    @abstractmethod
+    def _write(self, path, content, mtime):
+        pass
+
+    @abstractmethod
+    def _remove(self, path):
+        pass
+
+    @abstractmethod
+    def _clear(self, path):
+        pass
+
+    @abstractmethod
+    def _transaction(self):
+        pass
+
+
+class FileCacheBackend(CacheBackend):
+    # Each entry is a file, which is always replaced atomically so
+    # readers never see partial content. Transactions hold an exclusive
+    # advisory lock on the cache root's lock file. The index is kept in
+    # a separate sqlite database.
+    NAME = 'file'
+    LOCKNAME = '.lock'
+    TMPPREFIX = '.tmp_'
+    INDEXNAME = 'index.sqlite3'
+
+    def __init__(self, root):
+        super().__init__(root)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._lockfd = None
+        self._index = CacheIndex(SqliteDb(root / self.INDEXNAME), rescan=self._rescan)
+
+    @property
+    def index(self):
+        return self._index
+
+    def _is_entry(self, name):
+        return not (name.startswith('.') or name.startswith(self.INDEXNAME))
+
+    @cached_property
+    def umask(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        return umask
+
+    def _rescan(self):
+        # Index the entries of an existing cache
+        for dirpath, dirnames, filenames in os.walk(str(self.root)):
+            for filename in filter(self._is_entry, filenames):
+                path = Path(dirpath) / filename
+                stat = path.stat()
+                self.index.add(self._key(path), stat.st_size, 0, atime=stat.st_mtime, mtime=stat.st_mtime)
+
+    def _read(self, path):
+        # The mtime is from the index, if it's there
+        try:
+            content = path.read_bytes()
+            entry = self.index.lookup(self._key(path))
+            return (content, entry[0] if entry and entry[0] else path.stat().st_mtime)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError) as e:
+            raise CacheMiss() from e
+
+    def _write(self, path, content, mtime):
+        import tempfile
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=self.TMPPREFIX)
+        try:
+            # mkstemp always uses mode 0600, but use the normal mode
+            os.fchmod(fd, 0o666 & ~self.umask)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content if isinstance(content, bytes) else content.encode())
+            os.utime(tmp, (mtime, mtime))
+            os.replace(tmp, path)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+
+    def _remove(self, path):
+        path.unlink(missing_ok=True)
+
+    def _clear(self, path):
+        if not path.is_dir():
+            return
+        import shutil
+        # Keep the lock file (since other processes may be waiting on
+        # it) and the index (which is updated by our caller)
+        for f in path.iterdir():
+            if f.is_dir() and not f.is_symlink():
+                shutil.rmtree(f)
+            elif self._is_entry(f.name) or f.name.startswith(self.TMPPREFIX):
+                f.unlink(missing_ok=True)
+
+    def _flock(self, op):
+        # Returns False if op is non-blocking and the lock is held elsewhere
+        if self._lockfd is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._lockfd = os.open(self.root / self.LOCKNAME, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._lockfd, op)
+        except BlockingIOError:
+            return False
+        return True
+
+    @contextmanager
+    def _locked(self, op):
+        with self._lock:
+            if self._depth == 0:
+                self._flock(op)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._flock(fcntl.LOCK_UN)
+
+    @contextmanager
+    def _transaction(self):
+        with self._locked(fcntl.LOCK_EX), self.index.db.transaction():
+            yield
+
+    @contextmanager
+    def shared(self):
+        with self._lock:
+            if self._depth or self._flock(fcntl.LOCK_SH | fcntl.LOCK_NB):
+                if not self._depth:
+                    self._flock(fcntl.LOCK_UN)
+                yield False
+                return
+            with self._locked(fcntl.LOCK_SH):
+                yield True
+
+
+class SqliteCacheBackend(CacheBackend):
+    # All entries are rows in a single sqlite database (in WAL mode),
+    # with their write time stored instead of using the file mtime; the
+    # index is in the same database
+    NAME = 'sqlite'
+    DBNAME = 'cache.sqlite3'
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS entries (
+            path TEXT PRIMARY KEY, content BLOB NOT NULL, mtime REAL NOT NULL
+        ) WITHOUT ROWID;
+    '''
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.db = SqliteDb(root / self.DBNAME, self.SCHEMA)
+        self._index = CacheIndex(self.db, rescan=self._rescan)
+
+    @property
+    def index(self):
+        return self._index
+
+    def _rescan(self):
+        self.db.execute('INSERT INTO entry_index (path, size, atime, cost, mtime) '
+                        'SELECT path, LENGTH(CAST(content AS BLOB)), mtime, 0, mtime FROM entries')
+
+    def _read(self, path):
+        rows = self.db.execute('SELECT content, mtime FROM entries WHERE path = ?', (self._key(path),))
+        if not rows:
+            raise CacheMiss()
+        return rows[0]
+
+    def _write(self, path, content, mtime):
+        self.db.execute('INSERT OR REPLACE INTO entries (path, content, mtime) VALUES (?, ?, ?)',
+                        (self._key(path), content, mtime))
+
+    def _remove(self, path):
+        self.db.execute('DELETE FROM entries WHERE path = ?', (self._key(path),))
+
+    def _clear(self, path):
+        self.db.execute('DELETE FROM entries WHERE path >= ? AND path < ?',
+                        self._range(self._dir_prefix(path)))
+
+    def _transaction(self):
+        # Use the index's db, so its schema is set up before starting
+        return self.index.db.transaction()
+
+
+CACHE_BACKENDS = {c.NAME: c for c in (FileCacheBackend, SqliteCacheBackend)}
+
+
+# All the backends returned by get_cache_backend()
+CACHE_BACKEND_INSTANCES = []
+
+
+@cache
+def get_cache_backend(name, root):
+    # All caches with the same root share one backend
+    backend = CACHE_BACKENDS[name or DEFAULT_CACHE_BACKEND](root)
+    CACHE_BACKEND_INSTANCES.append(backend)
+    return backend
+
+
+def flush_cache_backends():
+    # For exiting without running the atexit handlers
+    for backend in CACHE_BACKEND_INSTANCES:
+        backend.flush()
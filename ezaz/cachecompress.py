@@ -0,0 +1,145 @@
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import zlib
+
+from functools import cache
+from pathlib import Path
+
+
+# Large cache entries (e.g. the vm list-skus lists) are stored
+# compressed, with a marker that can't start json content. Cache reads
+# return the stored data, which Info.load()/load_list() decompress.
+#
+# To compare the read time of compressed and uncompressed entries, run
+#   python3 -m ezaz.cachecompress benchmark [CACHEDIR]
+
+MAGIC = b'\0ezaz'
+COMPRESS_THRESHOLD = 16 * 1024
+
+
+class ZlibCodec:
+    NAME = 'zlib'
+    ID = b'z'
+
+    def compress(self, data):
+        return zlib.compress(data, 6)
+
+    def decompress(self, data):
+        try:
+            return zlib.decompress(data)
+        except zlib.error as e:
+            raise ValueError(f'Invalid zlib data: {e}') from e
+
+
+class ZstdCodec:
+    NAME = 'zstd'
+    ID = b's'
+
+    def __init__(self, module):
+        self.module = module
+
+    def compress(self, data):
+        return self.module.ZstdCompressor(level=3).compress(data)
+
+    def decompress(self, data):
+        try:
+            return self.module.ZstdDecompressor().decompressobj().decompress(data)
+        except self.module.ZstdError as e:
+            raise ValueError(f'Invalid zstd data: {e}') from e
+
+
+@cache
+def get_codecs():
+    codecs = [ZlibCodec()]
+    try:
+        import zstandard
+        codecs.insert(0, ZstdCodec(zstandard))
+    except ImportError:
+        pass
+    return codecs
+
+
+def default_codec():
+    # The first is preferred
+    return get_codecs()[0]
+
+
+def compress(content, threshold=COMPRESS_THRESHOLD, codec=None):
+    # Returns the content uncompressed, if it's too small to bother
+    if len(content) < threshold:
+        return content.encode()
+    codec = codec or default_codec()
+    return MAGIC + codec.ID + codec.compress(content.encode())
+
+
+def decompress(data):
+    # Accepts stored data, either compressed or not, as bytes or str;
+    # raises ValueError if it's invalid
+    if isinstance(data, str):
+        return data
+    if not data.startswith(MAGIC):
+        return data.decode()
+    codecid = data[len(MAGIC):len(MAGIC) + 1]
+    for codec in get_codecs():
+        if codec.ID == codecid:
+            return codec.decompress(data[len(MAGIC) + 1:]).decode()
+    raise ValueError(f'Unknown cache compression: {codecid}')
+
+
+def benchmark_contents(cachedir):
+    if cachedir:
+        for path in sorted(Path(cachedir).rglob('*')):
+            if path.is_file() and not path.name.startswith('.') and path.suffix != '.sqlite3':
+                content = decompress(path.read_bytes())
+                if len(content) >= COMPRESS_THRESHOLD:
+                    yield path.name, content
+        return
+
+    from .azrecord import AzSynthesizer
+    synth = AzSynthesizer(tempfile.gettempdir(), subscriptions=1, groups=0, vms=0, locations=20, skus=2000, seed=0)
+    yield 'synthesized sku list', json.dumps([synth.sku(n) for n in range(synth.skus)])
+
+
+def benchmark(cachedir, repeat):
+    codecs = [None, *get_codecs()]
+    print(f'{"entry":40} {"codec":6} {"size":>10} {"ratio":>6} {"write ms":>9} {"read ms":>8}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / 'entry'
+        for name, content in benchmark_contents(cachedir):
+            for codec in codecs:
+                start = time.perf_counter()
+                data = compress(content, threshold=0, codec=codec) if codec else content.encode()
+                path.write_bytes(data)
+                write_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    decompress(path.read_bytes())
+                read_ms = (time.perf_counter() - start) * 1000 / repeat
+
+                ratio = len(content.encode()) / len(data)
+                print(f'{name[:40]:40} {codec.NAME if codec else "none":6} {len(data):>10} {ratio:>6.1f} {write_ms:>9.2f} {read_ms:>8.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m ezaz.cachecompress",
+                                     description='Cache compression tools')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    bench = subparsers.add_parser('benchmark', help='Compare the read time of compressed and uncompressed cache entries')
+    bench.add_argument('cachedir', nargs='?', help='Use the large entries in this (file backend) cache dir, instead of a synthesized sku list')
+    bench.add_argument('--repeat', type=int, default=20)
+
+    options = parser.parse_args()
+
+    if options.action == 'benchmark':
+        benchmark(options.cachedir, options.repeat)
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,300 @@
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import suppress
+from pathlib import Path
+
+from . import LOGGER
+from .exception import CacheMiss
+
+
+# An optional per-user daemon, which keeps the (decompressed) cache
+# entries in memory, so each ezaz invocation doesn't need to read them
+# from disk. It's enabled with --cache-daemon, or by setting
+# EZAZ_CACHE_DAEMON; the first invocation starts it (in the background)
+# and it exits after IDLE_SECONDS without any clients.
+#
+# The daemon checks each entry's version and generation against its own
+# (periodically reread) snapshot of the cache index, so it notices
+# changes made by any process; processes using it also tell it about
+# their changes, so it notices them right away.
+#
+# The protocol is one json object per line, in both directions; an
+# entry's content follows its response line as a raw (utf-8) payload,
+# whose length is the response's 'size'.
+
+IDLE_SECONDS = 15 * 60
+MAX_BYTES = 64 * 1024 * 1024
+TIMEOUT = 5
+
+
+def socket_path(backend_name, root):
+    # In a dir only we can use, since the socket serves our cache
+    rundir = Path(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()) / f'ezaz-{os.getuid()}'
+    rundir.mkdir(mode=0o700, exist_ok=True)
+    if rundir.stat().st_uid != os.getuid():
+        raise OSError(f"'{rundir}' is not owned by us")
+    name = hashlib.sha256(f'{backend_name}:{root}'.encode()).hexdigest()[:16]
+    return rundir / f'cache-{name}.sock'
+
+
+class CacheDaemonClient:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._sock = None
+        self._file = None
+        self._failed = False
+
+    def _connect(self, start):
+        try:
+            path = socket_path(self.backend.NAME, self.backend.root)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(TIMEOUT)
+            try:
+                sock.connect(str(path))
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                # This invocation reads from disk; later ones use the daemon
+                if start:
+                    self._start()
+                return False
+        except OSError as ose:
+            LOGGER.debug(f'Not using cache daemon: {ose}')
+            return False
+        self._sock = sock
+        self._file = sock.makefile('rwb')
+        return True
+
+    def _start(self):
+        LOGGER.debug('Starting cache daemon')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+        subprocess.Popen([sys.executable, '-m', __name__,
+                          '--cachedir', str(self.backend.root),
+                          '--cache-backend', self.backend.NAME],
+                         env=env, start_new_session=True,
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _request(self, request, start=True):
+        # Returns the response, or None if the daemon isn't available
+        with self._lock:
+            if self._failed:
+                return None
+            if not self._sock and not self._connect(start):
+                self._failed = True
+                return None
+            try:
+                self._file.write(json.dumps(request).encode() + b'\n')
+                self._file.flush()
+                line = self._file.readline()
+                if not line:
+                    raise OSError('cache daemon exited')
+                response = json.loads(line)
+                if 'size' in response:
+                    response['content'] = self._file.read(response['size'])
+                    if len(response['content']) != response['size']:
+                        raise OSError('cache daemon exited')
+                return response
+            except (OSError, ValueError) as e:
+                LOGGER.debug(f'Not using cache daemon: {e}')
+                self._failed = True
+                with suppress(OSError):
+                    self._sock.close()
+                return None
+
+    def read(self, path, group):
+        # Returns (content, mtime), raises CacheMiss, or returns None
+        # if the daemon isn't available
+        response = self._request({'op': 'read',
+                                  'key': self.backend._key(path),
+                                  'group': self.backend._key(group) if group else None})
+        if response is None:
+            return None
+        if 'content' not in response:
+            raise CacheMiss()
+        return (response['content'], response['mtime'])
+
+    # These don't start the daemon; if it isn't running, there's
+    # nothing for it to forget
+    def changed(self, path):
+        self._request({'op': 'changed', 'key': self.backend._key(path)}, start=False)
+
+    def invalidated(self):
+        self._request({'op': 'invalidated'}, start=False)
+
+    def cleared(self):
+        self._request({'op': 'cleared'}, start=False)
+
+
+class CacheDaemonClients:
+    def __init__(self):
+        self.enabled = bool(os.environ.get('EZAZ_CACHE_DAEMON'))
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, backend):
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._clients.setdefault(id(backend), CacheDaemonClient(backend))
+
+
+CACHE_DAEMON = CacheDaemonClients()
+
+
+class CacheDaemon:
+    def __init__(self, backend):
+        self.backend = backend
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.clients = 0
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def read(self, key, group):
+        from .cachecompress import decompress
+        index = self.backend.index
+        path = self.backend.root / key
+        entry = index.lookup(key)
+        with self._lock:
+            cached = self.entries.get(key)
+            if cached:
+                self.entries.move_to_end(key)
+        # The version, not the mtime, as updates keep the mtime
+        if cached and entry and cached[2] == entry[2] and not (group and index.is_obsolete(key, group)):
+            index.touch(key)
+            return cached[:2]
+
+        content, mtime = self.backend.read(path, group=self.backend.root / group if group else None)
+        # Kept encoded, so it's sent as is
+        # The entry was looked up first, so if it's written in the
+        # meantime, its newer content is reread next time
+        cached = (decompress(content).encode(), mtime, entry[2] if entry else None)
+        self._store(key, cached)
+        return cached[:2]
+
+    def _store(self, key, cached):
+        with self._lock:
+            self._forget(key)
+            self.entries[key] = cached
+            self.bytes += len(cached[0])
+            while self.bytes > MAX_BYTES:
+                self._forget(next(iter(self.entries)))
+
+    def _forget(self, key):
+        cached = self.entries.pop(key, None)
+        if cached:
+            self.bytes -= len(cached[0])
+
+    def changed(self, key):
+        with self._lock:
+            self._forget(key)
+        self.backend.index.forget(key)
+
+    def cleared(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+        self.backend.index.forget()
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'read':
+            try:
+                content, mtime = self.read(request['key'], request.get('group'))
+            except (CacheMiss, ValueError):
+                return {}
+            return {'content': content, 'mtime': mtime}
+        if op == 'changed':
+            self.changed(request['key'])
+        elif op == 'invalidated':
+            self.backend.index.forget(generations=True)
+        elif op == 'cleared':
+            self.cleared()
+        else:
+            return {'error': f'Unknown op: {op}'}
+        return {}
+
+    def serve_client(self, conn):
+        with self._lock:
+            self.clients += 1
+        try:
+            with conn, conn.makefile('rwb') as f:
+                for line in f:
+                    try:
+                        response = self.handle(json.loads(line))
+                    except Exception as e:
+                        response = {'error': str(e)}
+                    content = response.pop('content', None)
+                    if content is not None:
+                        response['size'] = len(content)
+                    f.write(json.dumps(response).encode() + b'\n' + (content or b''))
+                    f.flush()
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self.clients -= 1
+                self.last = time.monotonic()
+
+    def is_idle(self):
+        with self._lock:
+            return not self.clients and time.monotonic() - self.last > IDLE_SECONDS
+
+    def serve(self, sock):
+        sock.settimeout(10)
+        while not self.is_idle():
+            try:
+                conn, _ = sock.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            threading.Thread(target=self.serve_client, args=(conn,), daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m ezaz.cachedaemon",
+                                     description='Serve cache entries from memory (this is started by ezaz, in the background)')
+    parser.add_argument('--cachedir', required=True)
+    parser.add_argument('--cache-backend', required=True)
+
+    options = parser.parse_args()
+
+    from .cachebackend import get_cache_backend
+    backend = get_cache_backend(options.cache_backend, Path(options.cachedir))
+    path = socket_path(backend.NAME, backend.root)
+
+    # Only one daemon per socket; the lock is held until we exit
+    lockfd = os.open(f'{path}.lock', os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return 0
+
+    with suppress(FileNotFoundError):
+        path.unlink()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(str(path))
+    sock.listen()
+    try:
+        CacheDaemon(backend).serve(sock)
+    finally:
+        path.unlink()
+        sock.close()
+        backend.index.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
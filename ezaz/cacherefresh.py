@@ -0,0 +1,91 @@
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+from . import LOGGER
+
+
+# Refreshes an expired (but still usable, per its stale expiry) cache
+# entry in a detached process, so the command that found the stale
+# entry can use it without waiting for az.
+
+# The refreshes already started by this process
+_started = set()
+
+
+def start_refresh(azobject, action):
+    cache = azobject.cache
+    if cache.dry_run or cache.no_cache_write:
+        return
+
+    from .config import Config
+    ids = azobject.get_azobject_id_opts()
+    key = (azobject.azobject_name(), action, json.dumps(ids, sort_keys=True))
+    if key in _started:
+        return
+    _started.add(key)
+
+    args = [sys.executable, '-m', 'ezaz.cacherefresh',
+            '--cachedir', str(cache.backend.root),
+            '--cache-backend', cache.backend.NAME,
+            '--configfile', str(Config.get_global_config().configfile),
+            *key]
+    # Our sys.path may include the venv, which the refresh needs too
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    from .cachedaemon import CACHE_DAEMON
+    if CACHE_DAEMON.enabled:
+        env['EZAZ_CACHE_DAEMON'] = '1'
+    LOGGER.debug(f'Starting cache refresh: {" ".join(key)}')
+    subprocess.Popen(args, env=env, start_new_session=True,
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def refresh(azobject_name, action, ids, *, cachedir, cache_backend):
+    from .azobject.user import User
+    azclass = User.get_descendant_classmap(include_self=True)[azobject_name]
+    opts = dict(ids, cachedir=cachedir, cache_backend=cache_backend, verbose=0, dry_run=False)
+    if action == 'list':
+        azclass.get_null_instance(**opts).list(no_cache=True)
+    else:
+        azclass.get_specific_instance(**opts).show(no_cache=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m ezaz.cacherefresh",
+                                     description='Refresh a cache entry (this is run by ezaz, in the background)')
+    parser.add_argument('--cachedir', required=True)
+    parser.add_argument('--cache-backend', required=True)
+    parser.add_argument('--configfile', required=True)
+    parser.add_argument('azobject_name')
+    parser.add_argument('action', choices=['show', 'list'])
+    parser.add_argument('ids', help='The azobject ids, in json')
+
+    options = parser.parse_args()
+
+    # Only one process refreshes each entry at a time
+    name = hashlib.sha256(' '.join((options.azobject_name, options.action, options.ids)).encode()).hexdigest()
+    os.makedirs(options.cachedir, exist_ok=True)
+    lockfile = os.path.join(options.cachedir, f'.refresh_{name[:16]}')
+    lockfd = os.open(lockfile, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return 0
+
+    try:
+        from .config import Config
+        Config.set_global_config(options.configfile)
+        refresh(options.azobject_name, options.action, json.loads(options.ids),
+                cachedir=options.cachedir, cache_backend=options.cache_backend)
+    finally:
+        os.unlink(lockfile)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+
+import io
+import json
+import tarfile
+import time
+import urllib.parse
+
+from pathlib import PurePosixPath
+
+from .exception import CacheMiss
+from .exception import InvalidCache
+from .exception import InvalidInfo
+
+
+# A cache snapshot is a gzipped tar file, with a metadata.json member
+# describing each entry (its key, mtime, cost, and group), followed by
+# the entries' stored content, under entries/. Importing a snapshot
+# into another cache (e.g. on a new machine, or a CI runner) saves
+# refetching the entries that rarely change, like the locations and vm
+# skus.
+
+SNAPSHOT_VERSION = 3
+METADATA = 'metadata.json'
+ENTRIES = 'entries'
+# Longest first, so 'id_list_...' isn't taken as a 'list_...' entry
+CACHETYPES = ('id_list', 'absent', 'show', 'list')
+
+
+def parse_entry_name(name, classnames):
+    # Returns (cachetype, classname, objid) from an entry name (see
+    # BaseCache._file()), or None if it isn't an entry of a known
+    # class; objid is None for list entries
+    cachetype = next((c for c in CACHETYPES if name.startswith(c + '_')), None)
+    if not cachetype:
+        return None
+    rest = name[len(cachetype) + 1:]
+    # Class names may contain '_', so use the longest that matches
+    for classname in sorted(classnames, key=len, reverse=True):
+        if cachetype in ('show', 'absent'):
+            if rest.startswith(classname + '_'):
+                return (cachetype, classname, urllib.parse.unquote_plus(rest[len(classname) + 1:]))
+        elif rest == classname or rest.endswith('_' + classname):
+            return (cachetype, classname, None)
+    return None
+
+
+def export_snapshot(backend, filename, classnames, select=None):
+    # Exports the (not obsolete) entries of the classes, and cache
+    # types, that select(cachetype, classname) returns True for.
+    # Returns the number of entries exported
+    metadata = []
+    contents = []
+    for path, cost in backend.entries(backend.root):
+        parsed = parse_entry_name(path.name, classnames)
+        if not parsed or parsed[0] == 'absent':
+            continue
+        cachetype, classname, _ = parsed
+        if select and not select(cachetype, classname):
+            continue
+        group = path.with_name(f'show_{classname}') if cachetype == 'show' else None
+        try:
+            content, mtime = backend.read(path, group=group)
+        except CacheMiss:
+            continue
+        if cachetype == 'show':
+            content = resolve_ref(backend, path, content)
+            if content is None:
+                continue
+        key = backend._key(path)
+        metadata.append({'key': key,
+                         'mtime': mtime,
+                         'cost': cost,
+                         'group': backend._key(group) if group else None,
+                         'cachetype': cachetype,
+                         'classname': classname})
+        contents.append(content if isinstance(content, bytes) else content.encode())
+
+    with tarfile.open(filename, 'w:gz') as tar:
+        addfile(tar, METADATA, json.dumps({'version': SNAPSHOT_VERSION,
+                                           'created': time.time(),
+                                           'entries': metadata}).encode())
+        for entry, content in zip(metadata, contents):
+            addfile(tar, f'{ENTRIES}/{entry["key"]}', content, mtime=entry['mtime'])
+    return len(metadata)
+
+
+def resolve_ref(backend, path, content):
+    # A show entry may be a reference into its list entry (see
+    # InfoCache), which may not be exported, or may expire in the
+    # importing cache, so export the info itself instead. Returns None
+    # if the info isn't in the list (any more)
+    from .azobject.info import Info
+    from .cache import InfoCache
+    from .cachecompress import compress
+    from .cachecompress import decompress
+    try:
+        ref = InfoCache.parse_ref(decompress(content))
+        if not ref:
+            return content
+        listname, objid = ref
+        info = Info.load_list_info(backend.read(path.with_name(listname))[0], objid, verbose=0)
+    except (CacheMiss, InvalidInfo, ValueError):
+        return None
+    return compress(info.save()) if info else None
+
+
+def addfile(tar, name, content, mtime=None):
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mtime = mtime or time.time()
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(content))
+
+
+def entry_key(key):
+    # Don't allow a snapshot to write outside the cache
+    path = PurePosixPath(key)
+    if path.is_absolute() or '..' in path.parts or not path.parts or path.name.startswith('.'):
+        raise InvalidCache(f"Invalid cache snapshot entry '{key}'")
+    return path.as_posix()
+
+
+def import_snapshot(backend, filename, restamp=False):
+    # Imports all the snapshot entries, keeping their mtimes unless
+    # restamp; existing entries that are newer than the snapshot's are
+    # kept. Returns (imported, skipped)
+    imported = skipped = 0
+    try:
+        with tarfile.open(filename, 'r:*') as tar:
+            metadata = json.load(tar.extractfile(METADATA))
+            if metadata.get('version') != SNAPSHOT_VERSION:
+                raise InvalidCache(f"Unsupported cache snapshot version '{metadata.get('version')}'")
+            with backend.transaction():
+                for entry in metadata['entries']:
+                    path = backend.root / entry_key(entry['key'])
+                    group = backend.root / entry_key(entry['group']) if entry.get('group') else None
+                    if not restamp and is_newer(backend, path, group, entry['mtime']):
+                        skipped += 1
+                        continue
+                    content = tar.extractfile(f'{ENTRIES}/{entry["key"]}').read()
+                    backend.write(path, content, cost=entry['cost'], group=group, mtime=None if restamp else entry['mtime'])
+                    imported += 1
+    except (tarfile.TarError, KeyError, ValueError, AttributeError) as e:
+        raise InvalidCache(f"Invalid cache snapshot '{filename}': {e}") from e
+    return (imported, skipped)
+
+
+def is_newer(backend, path, group, mtime):
+    try:
+        return backend.read(path, group=group)[1] >= mtime
+    except CacheMiss:
+        return False
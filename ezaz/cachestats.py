@@ -0,0 +1,63 @@
+
+import atexit
+import threading
+import time
+
+from collections import Counter
+
+
+class CacheStats:
+    # Counts the cache reads and writes, per class name and cache type;
+    # the counts are added to the totals kept in the cache index at
+    # exit, so counting doesn't slow down the reads.
+    # The time from an unusable read (e.g. a miss) until the entry is
+    # written is the time spent fetching it from az, which is used to
+    # estimate the time saved by each hit
+    EVENTS = ('hit', 'stale', 'miss', 'expired', 'nocache', 'invalid',
+              'bytes_read', 'bytes_written', 'fetches', 'fetch_time')
+
+    def __init__(self, index):
+        self.index = index
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._fetching = {}
+
+    def count(self, classname, cachetype, event, n=1):
+        assert event in self.EVENTS
+        with self._lock:
+            if not self._counts:
+                atexit.register(self.flush)
+            self._counts[(classname, cachetype, event)] += n
+
+    def unusable(self, classname, cachetype, event, path):
+        self.count(classname, cachetype, event)
+        with self._lock:
+            self._fetching[path] = time.monotonic()
+
+    def written(self, classname, cachetype, path, size):
+        self.count(classname, cachetype, 'bytes_written', size)
+        with self._lock:
+            start = self._fetching.pop(path, None)
+        if start is not None:
+            self.count(classname, cachetype, 'fetches')
+            self.count(classname, cachetype, 'fetch_time', time.monotonic() - start)
+
+    def flush(self):
+        with self._lock:
+            counts = list(self._counts.items())
+            self._counts.clear()
+        if counts:
+            self.index.add_stats([(*key, n) for key, n in counts])
+
+    def totals(self):
+        # Returns {(classname, cachetype): {event: total}}
+        self.flush()
+        totals = {}
+        for classname, cachetype, event, value in self.index.stats():
+            totals.setdefault((classname, cachetype), dict.fromkeys(self.EVENTS, 0))[event] = value
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+        self.index.clear_stats()
@@ -1,11 +1,16 @@
 
 import json
+import sys
+import time
 
 from ..argutil import AzClassDescendantsChoicesArgConfig
+from ..argutil import AzObjectArgConfig
 from ..argutil import BoolArgConfig
 from ..argutil import ChoicesArgConfig
 from ..argutil import ConstArgConfig
 from ..argutil import GroupArgConfig
+from ..argutil import NumberArgConfig
+from ..argutil import PositionalArgConfig
 from ..argutil import TimeDeltaArgConfig
 from ..argutil import ExclusiveGroupArgConfig
 from ..exception import ArgumentError
@@ -34,8 +39,29 @@ class CacheCommand(AzObjectActionCommand):
                                        func='set_expiry',
                                        description='Set cache expiry duration',
                                        argconfigs=cls.get_set_action_argconfigs()),
+                cls.make_action_config('set-budget',
+                                       func='set_budget',
+                                       description='Set the cache size budget, beyond which the least recently used entries are evicted',
+                                       argconfigs=cls.get_set_budget_action_argconfigs()),
+                cls.make_action_config('warm',
+                                       description='Fill the caches of the default objects, and their children',
+                                       argconfigs=cls.get_warm_action_argconfigs()),
+                cls.make_action_config('load',
+                                       description='Load the resource group caches using Azure Resource Graph queries',
+                                       argconfigs=cls.get_load_action_argconfigs()),
+                cls.make_action_config('export',
+                                       func='export_snapshot',
+                                       description='Export cache entries to a snapshot file, which can be imported into another cache',
+                                       argconfigs=cls.get_export_action_argconfigs()),
+                cls.make_action_config('import',
+                                       func='import_snapshot',
+                                       description='Import the cache entries from a snapshot file',
+                                       argconfigs=cls.get_import_action_argconfigs()),
                 cls.make_action_config('size',
                                        description='Show the cache size'),
+                cls.make_action_config('stats',
+                                       description='Show the cache hit, miss, and expiry statistics',
+                                       argconfigs=cls.get_stats_action_argconfigs()),
                 cls.make_action_config('clear',
                                        description='Clear the cache')]
 
@@ -43,6 +69,51 @@ class CacheCommand(AzObjectActionCommand):
     def get_show_action_argconfigs(cls):
         return [*cls.azclass().get_descendant_azobject_id_argconfigs()]
 
+    @classmethod
+    def get_set_budget_action_argconfigs(cls):
+        return [NumberArgConfig('max_bytes', help='Maximum total size of all cache entries, in bytes (0 for unlimited)'),
+                NumberArgConfig('max_entries', help='Maximum number of cache entries (0 for unlimited)')]
+
+    @classmethod
+    def get_warm_action_argconfigs(cls):
+        from .topology import TopologyCommand
+        return [GroupArgConfig(*cls.azclass().get_descendant_azobject_id_argconfigs(help='Warm the specified {azobject_text} object, instead of the default'),
+                               BoolArgConfig('all', help='Warm all objects, not only the default objects'),
+                               title='Object instance selection options'),
+                GroupArgConfig(TopologyCommand.get_ignore_argconfig(verb='warm'),
+                               title='Object type selection options'),
+                NumberArgConfig('jobs', help='Maximum number of lists to fetch in parallel (default: the number of az jobs)')]
+
+    @classmethod
+    def get_export_action_argconfigs(cls):
+        return [PositionalArgConfig('file', help='The snapshot file to write'),
+                GroupArgConfig(AzClassDescendantsChoicesArgConfig('type',
+                                                                  dest='object_types',
+                                                                  include_self=True,
+                                                                  azclass=cls.azclass(),
+                                                                  multiple=True,
+                                                                  metavar='RESOURCE_NAME',
+                                                                  help='Export the entries of this object type (default: all types)'),
+                               BoolArgConfig('forever', help='Only export the entries that are cached forever (as configured for the user, or by default)'),
+                               title='Entry selection options')]
+
+    @classmethod
+    def get_import_action_argconfigs(cls):
+        return [PositionalArgConfig('file', help='The snapshot file to read'),
+                BoolArgConfig('restamp', help='Import the entries as if they were just fetched, instead of keeping their original times (and keeping any newer existing entries)')]
+
+    @classmethod
+    def get_stats_action_argconfigs(cls):
+        return [BoolArgConfig('reset', help='Reset the statistics, after showing them')]
+
+    @classmethod
+    def get_load_action_argconfigs(cls):
+        from ..azobject.subscription import Subscription
+        return [AzObjectArgConfig('subscription',
+                                  azclass=Subscription,
+                                  nodefault=True,
+                                  help='Only load the specified subscription (default: all subscriptions)')]
+
     @classmethod
     def get_set_action_argconfigs(cls):
         return [GroupArgConfig(*cls.azclass().get_descendant_azobject_id_argconfigs(),
@@ -72,12 +143,23 @@ class CacheCommand(AzObjectActionCommand):
                                         ConstArgConfig('list_cache_forever', const='forever', help="Cache 'list' command info forever"),
                                         ConstArgConfig('list_cache_none', const='none', help="Remove cache configuration for 'list' command info"),
                                         cmddest='list_expiry',
-                                        title='List command caching options')]
+                                        title='List command caching options'),
+                ExclusiveGroupArgConfig(TimeDeltaArgConfig('stale_cache_duration', help="How long after expiring to still use cached info, while refreshing it in the background"),
+                                        ConstArgConfig('stale_cache_forever', const='forever', help="Always use expired cached info, while refreshing it in the background"),
+                                        ConstArgConfig('stale_cache_none', const='none', help="Remove cache configuration for using expired cached info"),
+                                        cmddest='stale_expiry',
+                                        title='Expired cache options'),
+                ExclusiveGroupArgConfig(TimeDeltaArgConfig('absent_cache_duration', help="How long to remember that an object does not exist (default: 60 seconds, but never longer than 'show' command info)"),
+                                        ConstArgConfig('absent_cache_disable', const='nocache', help="Do not remember that an object does not exist"),
+                                        ConstArgConfig('absent_cache_none', const='none', help="Remove cache configuration for remembering that an object does not exist"),
+                                        cmddest='absent_expiry',
+                                        title='Nonexistent object caching options')]
 
     def show(self, **opts):
         self._indent = 0
         default_expiry = self.azclass().get_instance(**opts).default_cache_expiry()
         print(f"[Defaults: {self.expirystr(default_expiry)}]")
+        print(f"[Usage: {self.usagestr(self.azobject.cache.usage)}]")
         with self.indent():
             self.show_azclass(self.azclass(), opts)
 
@@ -118,43 +200,213 @@ class CacheCommand(AzObjectActionCommand):
 
         show_expiry = self.get_action_config('set-expiry').cmd_opts(**opts).get('show_expiry')
         list_expiry = self.get_action_config('set-expiry').cmd_opts(**opts).get('list_expiry')
-        if not show_expiry and not list_expiry:
-            raise RequiredArgumentGroup(['show_expiry', 'list_expiry'], 'set-expiry', exclusive=False)
+        stale_expiry = self.get_action_config('set-expiry').cmd_opts(**opts).get('stale_expiry')
+        absent_expiry = self.get_action_config('set-expiry').cmd_opts(**opts).get('absent_expiry')
+        if not show_expiry and not list_expiry and not stale_expiry and not absent_expiry:
+            raise RequiredArgumentGroup(['show_expiry', 'list_expiry', 'stale_expiry', 'absent_expiry'], 'set-expiry', exclusive=False)
 
         if default_config:
-            self.set_default_config(self.azclass(), show_expiry, list_expiry, opts)
+            self.set_default_config(self.azclass(), show_expiry, list_expiry, stale_expiry, absent_expiry, opts)
         else:
-            assert self.set_azclass_expiry(self.azclass(), config_location, object_type, show_expiry, list_expiry, opts)
+            assert self.set_azclass_expiry(self.azclass(), config_location, object_type, show_expiry, list_expiry, stale_expiry, absent_expiry, opts)
 
-    def set_azclass_expiry(self, azclass, config_location, object_type, show_expiry, list_expiry, opts):
+    def set_azclass_expiry(self, azclass, config_location, object_type, show_expiry, list_expiry, stale_expiry, absent_expiry, opts):
         if azclass.azobject_name() == config_location:
             azobject = azclass.get_instance(**opts)
-            expiry = self.set_expiry_attrs(azobject.cache_expiry(object_type), show_expiry, list_expiry)
+            expiry = self.set_expiry_attrs(azobject.cache_expiry(object_type), show_expiry, list_expiry, stale_expiry, absent_expiry)
             print(f'Set {config_location} id {azobject.azobject_id} cache config for {object_type} objects to: {self.expirystr(expiry)}')
             return True
 
         for child_class in azclass.get_child_classes():
-            if self.set_azclass_expiry(child_class, config_location, object_type, show_expiry, list_expiry, opts):
+            if self.set_azclass_expiry(child_class, config_location, object_type, show_expiry, list_expiry, stale_expiry, absent_expiry, opts):
                 return True
 
         return False
 
-    def set_default_config(self, azclass, show_expiry, list_expiry, opts):
-        expiry = self.set_expiry_attrs(azclass.get_instance(**opts).default_cache_expiry(), show_expiry, list_expiry)
+    def set_default_config(self, azclass, show_expiry, list_expiry, stale_expiry, absent_expiry, opts):
+        expiry = self.set_expiry_attrs(azclass.get_instance(**opts).default_cache_expiry(), show_expiry, list_expiry, stale_expiry, absent_expiry)
         print(f'Set default cache config to: {self.expirystr(expiry)}')
 
-    def set_expiry_attrs(self, expiry, show_expiry, list_expiry):
+    def set_expiry_attrs(self, expiry, show_expiry, list_expiry, stale_expiry, absent_expiry):
         if show_expiry is not None:
             expiry.show_expiry = None if show_expiry == 'none' else show_expiry
         if list_expiry is not None:
             expiry.list_expiry = None if list_expiry == 'none' else list_expiry
+        if stale_expiry is not None:
+            expiry.stale_expiry = None if stale_expiry == 'none' else stale_expiry
+        if absent_expiry is not None:
+            expiry.absent_expiry = None if absent_expiry == 'none' else absent_expiry
         return expiry
 
     def expirystr(self, expiry, none='No configuration'):
         return expiry._to_json() if expiry else none
 
+    def load(self, subscription=None, **opts):
+        from ..azobject.resourcegraph import ResourceGraph
+        from ..azobject.subscription import Subscription
+        graph = ResourceGraph(verbose=self.verbose, dry_run=self.dry_run)
+        if subscription:
+            subscriptions = [self.azobject.get_child(Subscription.azobject_name(), subscription)]
+        else:
+            subscriptions = self.azobject.get_children(Subscription.azobject_name())
+        for sub in subscriptions:
+            count = graph.load_subscription(sub)
+            print(f'Loaded {count} objects for subscription {sub.azobject_id}')
+
+    def usagestr(self, usage):
+        max_bytes = f'{usage.max_bytes} bytes' if usage.max_bytes else 'unlimited'
+        max_entries = f'{usage.max_entries} entries' if usage.max_entries else 'unlimited'
+        return f'{usage.bytes} bytes (budget {max_bytes}), {usage.entries} entries (budget {max_entries})'
+
+    def set_budget(self, max_bytes=None, max_entries=None, **opts):
+        if max_bytes is None and max_entries is None:
+            raise RequiredArgumentGroup(['max_bytes', 'max_entries'], 'set-budget', exclusive=False)
+        if any(v is not None and v < 0 for v in (max_bytes, max_entries)):
+            raise ArgumentError('The cache budget cannot be negative')
+        self.azobject.cache.set_budget(max_bytes=max_bytes, max_entries=max_entries)
+        print(f'Cache usage: {self.usagestr(self.azobject.cache.usage)}')
+
+    def warm(self, all=False, jobs=None, ignore=None, ignore_also=None, ignore_none=False, **opts):
+        from concurrent.futures import FIRST_COMPLETED
+        from concurrent.futures import wait
+        from ..azexecutor import AZ_EXECUTOR
+        from ..azobject.azobject import AzListable
+        from ..cachesnapshot import parse_entry_name
+        from .topology import TopologyCommand
+
+        ignore = TopologyCommand.get_ignore(ignore, ignore_also, ignore_none)
+        jobs = jobs or AZ_EXECUTOR.max_workers
+        start = time.monotonic()
+        queue = []
+        running = {}
+        lists = objects = errors = 0
+
+        def add_children(parent):
+            for childcls in parent.get_child_classes():
+                if childcls.azobject_name() not in ignore and issubclass(childcls, AzListable):
+                    queue.append((parent, childcls))
+
+        def is_cached(parent, childcls, children):
+            # The list must be cached in its own parent's cache dir, and
+            # its children must be in the parent (not in another object
+            # with the same id)
+            if any(child.parent is not parent for child in children):
+                return False
+            if self.dry_run:
+                return True
+            cache = parent.get_null_child(childcls.azobject_name()).cache
+            return any(path.parent == cache.cachepath and parse_entry_name(path.name, [cache.classname]) == ('list', cache.classname, None)
+                       for path, _ in cache.backend.entries(cache.cachepath))
+
+        def progress(end=''):
+            if sys.stderr.isatty():
+                print(f'\rFetched {lists} lists ({objects} objects), {len(running)} running, {len(queue)} queued',
+                      end=end, file=sys.stderr, flush=True)
+
+        # Always fetch, even if the caches are still valid
+        with self.azobject.cache.temporary_no_cache():
+            add_children(self.azobject)
+            while queue or running:
+                while queue and len(running) < jobs:
+                    parent, childcls = queue.pop(0)
+                    future = AZ_EXECUTOR.submit(parent.get_children, childcls.azobject_name())
+                    running[future] = (parent, childcls)
+                progress()
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    parent, childcls = running.pop(future)
+                    try:
+                        children = future.result()
+                    except Exception as e:
+                        self.warn_failed(parent, childcls, e)
+                        errors += 1
+                        continue
+                    if not is_cached(parent, childcls, children):
+                        self.warn_failed(parent, childcls, 'the list was not cached')
+                        errors += 1
+                        continue
+                    lists += 1
+                    objects += len(children)
+                    for child in children:
+                        if all or self.warm_is_default(parent, child, opts):
+                            add_children(child)
+        progress(end='\n')
+
+        failed = f', {errors} failed' if errors else ''
+        print(f'Warmed the cache with {lists} lists ({objects} objects){failed} in {time.monotonic() - start:.1f} seconds')
+
+    def warm_is_default(self, parent, child, opts):
+        specified_id = child.get_azobject_id_from_opts(opts)
+        if specified_id:
+            return specified_id == child.azobject_id
+        try:
+            return parent.get_default_child_id(child.azobject_name()) == child.azobject_id
+        except DefaultConfigNotFound:
+            return False
+
+    def warn_failed(self, parent, childcls, e):
+        from .. import LOGGER
+        LOGGER.warning(f'Failed to list {childcls.azobject_text()}s of {parent.azobject_text()} {parent.azobject_id}: {e}')
+
+    def export_snapshot(self, file, object_types=None, forever=False, **opts):
+        from ..cache import CacheExpiry
+        from ..cachesnapshot import export_snapshot
+
+        def select(cachetype, classname):
+            if object_types and classname not in object_types:
+                return False
+            if forever:
+                expiry = self.azobject.find_cache_expiry(classname)
+                return (expiry.show_expiry if cachetype == 'show' else expiry.list_expiry) == CacheExpiry.FOREVER
+            return True
+
+        classnames = self.azclass().get_descendant_classmap(include_self=True).keys()
+        count = export_snapshot(self.azobject.cache.backend, file, classnames, select)
+        print(f'Exported {count} cache entries to {file}')
+
+    def import_snapshot(self, file, restamp=False, **opts):
+        from ..cachesnapshot import import_snapshot
+        if self.dry_run:
+            print(f'Would import cache entries from {file}')
+            return
+        imported, skipped = import_snapshot(self.azobject.cache.backend, file, restamp=restamp)
+        newer = f' ({skipped} existing entries are newer)' if skipped else ''
+        print(f'Imported {imported} cache entries from {file}{newer}')
+
     def size(self, **opts):
-        print(f'Cache is {self.azobject.cache.size} bytes')
+        print(f'Cache is {self.usagestr(self.azobject.cache.usage)}')
+
+    def stats(self, reset=False, **opts):
+        cachestats = self.azobject.cache.stats
+        totals = cachestats.totals()
+        if not totals:
+            print('No cache statistics')
+            return
+
+        # The average fetch time of each cache type, for entries of
+        # classes that haven't been fetched (since the last reset)
+        fetches = {}
+        for (classname, cachetype), t in totals.items():
+            count, fetch_time = fetches.get(cachetype, (0, 0))
+            fetches[cachetype] = (count + t['fetches'], fetch_time + t['fetch_time'])
+
+        print(f'{"class":24} {"type":8} {"hits":>7} {"stale":>6} {"misses":>7} {"expired":>7} {"nocache":>7} {"invalid":>7} '
+              f'{"hit%":>5} {"read":>11} {"written":>11} {"fetch s":>8} {"saved s":>8}')
+        saved = 0
+        for (classname, cachetype), t in sorted(totals.items()):
+            hits = t['hit'] + t['stale']
+            reads = hits + t['miss'] + t['expired'] + t['invalid']
+            count, fetch_time = (t['fetches'], t['fetch_time']) if t['fetches'] else fetches[cachetype]
+            fetch_avg = fetch_time / count if count else 0
+            saved += hits * fetch_avg
+            hitpct = f'{hits * 100 / reads:.0f}' if reads else '-'
+            print(f'{classname[:24]:24} {cachetype:8} {t["hit"]:>7} {t["stale"]:>6} {t["miss"]:>7} {t["expired"]:>7} {t["nocache"]:>7} {t["invalid"]:>7} '
+                  f'{hitpct:>5} {t["bytes_read"]:>11} {t["bytes_written"]:>11} {fetch_avg:>8.2f} {hits * fetch_avg:>8.1f}')
+        print(f'Estimated az time saved: {saved:.1f} seconds')
+
+        if reset and not self.dry_run:
+            cachestats.reset()
+            print('Reset the cache statistics')
 
     def clear(self, **opts):
         self.azobject.cache.clear()
@@ -15,6 +15,8 @@ from .command import SimpleCommand
 
 
 class TopologyCommand(SimpleCommand):
+    IGNORE_DEFAULT = ['location', 'role_definition', 'role_assignment', 'storage_key', 'sku']
+
     @classmethod
     def command_name_list(cls):
         return ['topology']
@@ -24,30 +26,38 @@ class TopologyCommand(SimpleCommand):
         from ..azobject.user import User
         return ArgMap(user=User, **{c.azobject_name(): c for c in User.get_descendant_classes()})
 
+    @classmethod
+    def get_ignore_argconfig(cls, verb='show'):
+        classnames = sorted(set(cls.get_root_classmap().keys()) - set('user'))
+        ignore_default = cls.IGNORE_DEFAULT
+        return ExclusiveGroupArgConfig(ChoicesArgConfig('ignore',
+                                                        multiple=True,
+                                                        choices=classnames,
+                                                        default=ignore_default,
+                                                        help=f'Do not {verb} these types of objects, or their children (default: {", ".join(ignore_default)})'),
+                                       ChoicesArgConfig('ignore_also',
+                                                        multiple=True,
+                                                        choices=sorted(set(classnames) - set(ignore_default)),
+                                                        default=[],
+                                                        help=f'Same as --ignore, but include the defaults as well'),
+                                       BoolArgConfig('ignore_none',
+                                                     help='Do not ignore any types of objects'))
+
+    @classmethod
+    def get_ignore(cls, ignore=None, ignore_also=None, ignore_none=False):
+        if ignore_none:
+            return []
+        return ignore or ignore_also or []
+
     @classmethod
     def get_simple_command_argconfigs(cls):
         from ..azobject.user import User
-        classmap = cls.get_root_classmap()
-        classnames = sorted(set(classmap.keys()) - set('user'))
-        ignore_default = ['location', 'role_definition', 'role_assignment', 'storage_key', 'sku']
-
         return [*super().get_simple_command_argconfigs(),
                 GroupArgConfig(ChoiceMapArgConfig('root',
-                                                  choicemap=classmap,
+                                                  choicemap=cls.get_root_classmap(),
                                                   default=User.azobject_name(),
                                                   help='Show the topology starting at this root object'),
-                               ExclusiveGroupArgConfig(ChoicesArgConfig('ignore',
-                                                                        multiple=True,
-                                                                        choices=classnames,
-                                                                        default=ignore_default,
-                                                                        help=f'Do not show these types of objects, or their children (default: {", ".join(ignore_default)})'),
-                                                       ChoicesArgConfig('ignore_also',
-                                                                        multiple=True,
-                                                                        choices=sorted(set(classnames) - set(ignore_default)),
-                                                                        default=[],
-                                                                        help=f'Same as --ignore, but include the defaults as well'),
-                                                       BoolArgConfig('ignore_none',
-                                                                     help='Do not ignore any types of objects')),
+                               cls.get_ignore_argconfig(),
                                title='Object type selection options'),
                 GroupArgConfig(*User.get_descendant_azobject_id_argconfigs(help='Only show the specified {azobject_text} object'),
                                BoolArgConfig('defaults_only', help='Only show the default objects'),
@@ -57,9 +67,7 @@ class TopologyCommand(SimpleCommand):
 
     @property
     def ignore(self):
-        if self.options.ignore_none:
-            return []
-        return self.options.ignore or self.options.ignore_also
+        return self.get_ignore(self.options.ignore, self.options.ignore_also, self.options.ignore_none)
 
     def topology(self, object_type_only=False, no_filters=False, **opts):
         self._indent = 0
@@ -75,19 +83,26 @@ class TopologyCommand(SimpleCommand):
                                                       opts,
                                                       context_manager=self.indent,
                                                       include_self=True,
-                                                      no_filters=no_filters)
+                                                      no_filters=no_filters,
+                                                      prefetch=lambda instance, childcls: (self.should_show(instance, opts) and
+                                                                                           childcls.azobject_name() not in self.ignore))
 
     def show_topology_classes(self, cls, opts):
         if cls.azobject_name() in self.ignore:
             raise StopIteration()
         print(f'{self.tab}{cls.__name__}')
 
-    def show_topology_instances(self, instance, opts):
+    def should_show(self, instance, opts):
         if instance.azobject_name() in self.ignore:
-            raise StopIteration()
+            return False
         if self.options.defaults_only and not instance.is_default:
-            raise StopIteration()
+            return False
         specified_id = instance.get_azobject_id_from_opts(opts)
         if specified_id and specified_id != instance.azobject_id:
+            return False
+        return True
+
+    def show_topology_instances(self, instance, opts):
+        if not self.should_show(instance, opts):
             raise StopIteration()
         print(f'{self.tab}{instance.__class__.__name__}: {instance.info()}')
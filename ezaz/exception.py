@@ -103,6 +103,14 @@ class AzCommandError(EzazException):
         self.stderr = stderr
 
 
+class AzWorkerError(EzazException):
+    pass
+
+
+class AzWorkerUnavailable(AzWorkerError):
+    pass
+
+
 class NoAzObjectExists(EzazException):
     def __init__(self, obj_name, obj_id):
         super().__init__(f'{obj_name} (id: {obj_id}) does not exist.')
@@ -251,6 +259,10 @@ class InvalidInfo(InfoError):
     pass
 
 
+class InvalidInfoVersion(InvalidInfo):
+    pass
+
+
 class VmError(EzazException):
     pass
 
@@ -276,3 +288,17 @@ class IpAddrError(EzazException):
 class NoPublicIp(IpAddrError):
     def __init__(self, nic):
         super().__init__(f'The ip address {ipaddr.azobject_id} has no public ip')
+
+
+class WaitError(EzazException):
+    pass
+
+
+class WaitTimeout(WaitError):
+    def __init__(self, obj_name, obj_id, condition, state):
+        super().__init__(f"Timed out waiting for {obj_name} (id: {obj_id}) to be {condition}; last state: {state}")
+
+
+class WaitFailed(WaitError):
+    def __init__(self, obj_name, obj_id, condition, state):
+        super().__init__(f"{obj_name} (id: {obj_id}) can't be {condition}; state: {state}")
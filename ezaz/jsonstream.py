@@ -0,0 +1,83 @@
+
+import json
+import re
+
+
+WHITESPACE = re.compile(r'\s*')
+NUMBER_CHARS = '0123456789.eE+-'
+
+
+class JsonArrayStream:
+    # This decodes a JSON array from an iterable of text chunks, and
+    # yields each array element as soon as it has been fully read. If
+    # the JSON value is not an array, the single value is yielded.
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _more(self):
+        # Returns False at the end of the stream; otherwise drops the
+        # already decoded part of the buffer and appends the next chunk
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _error(self, msg):
+        return json.JSONDecodeError(msg, self._buf, self._pos)
+
+    def _peek(self):
+        # Skip whitespace and return the next char, or '' at the end
+        while True:
+            self._pos = WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                return ''
+
+    def _value(self):
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise
+                continue
+            # A number at the end of the buffer might only be partially
+            # read, so only accept a value once something else follows it
+            if (end < len(self._buf) and self._buf[end] not in NUMBER_CHARS) or not self._more():
+                self._pos = end
+                return value
+
+    def __iter__(self):
+        c = self._peek()
+        if not c:
+            return
+        if c != '[':
+            yield self._value()
+        else:
+            self._pos += 1
+            if self._peek() == ']':
+                self._pos += 1
+            else:
+                while True:
+                    if not self._peek():
+                        raise self._error('Expecting value')
+                    yield self._value()
+                    c = self._peek()
+                    if c not in (',', ']'):
+                        raise self._error("Expecting ',' delimiter")
+                    self._pos += 1
+                    if c == ']':
+                        break
+        # Always read to the end, so the chunk source can finish
+        if self._peek():
+            raise self._error('Extra data')
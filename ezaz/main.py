@@ -1,5 +1,6 @@
 
 import argparse
+import os
 import sys
 import traceback
 
@@ -10,6 +11,7 @@ from . import IS_ARGCOMPLETE
 from . import ARGCOMPLETE_ARGS
 from .actionutil import ActionConfigGroup
 from .argutil import SharedArgumentParser
+from .azprofile import AZ_PROFILER
 from .timing import TIMESTAMP
 
 
@@ -27,7 +29,14 @@ class Main:
     def autocomplete(self, parser):
         with suppress(ImportError):
             import argcomplete
-            argcomplete.autocomplete(parser, print_suppressed=True, default_completer=None)
+            argcomplete.autocomplete(parser, print_suppressed=True, default_completer=None, exit_method=self.autocomplete_exit)
+
+    def autocomplete_exit(self, code):
+        # argcomplete exits with os._exit(), which doesn't run the
+        # atexit handlers that save the cache stats and access times
+        from .cachebackend import flush_cache_backends
+        flush_cache_backends()
+        os._exit(code)
 
     def parse_early_args(self):
         parser = SharedArgumentParser(add_help=False)
@@ -40,6 +49,30 @@ class Main:
         from .config import Config
         Config.set_global_config(options.configfile)
 
+        if options.cache_daemon:
+            from .cachedaemon import CACHE_DAEMON
+            CACHE_DAEMON.enabled = True
+
+        if options.no_az_worker:
+            from .azworker import AZ_WORKERS
+            AZ_WORKERS.disable('disabled by --no-az-worker')
+
+        if options.az_retries is not None:
+            from .azretry import AZ_RETRY
+            AZ_RETRY.max_retries = options.az_retries
+
+        if options.az_record:
+            from .azrecord import AZ_RECORDER
+            AZ_RECORDER.start(options.az_record)
+
+        if options.query_projection:
+            from .azobject.azobject import AzActionConfig
+            AzActionConfig.QUERY_PROJECTION = True
+
+        if options.az_jobs:
+            from .azexecutor import AZ_EXECUTOR
+            AZ_EXECUTOR.max_workers = options.az_jobs
+
         if IS_ARGCOMPLETE:
             # argcomplete does not use any logging
             return
@@ -73,6 +106,13 @@ class Main:
         group.add_argument('--debug-az', action='count', default=argparse.SUPPRESS, help='Enable debug of az commands (once to show cmds, twice to show response)')
         group.add_argument('--no-cache', action='store_true', help='Use no cached data (but still update the cache)')
         group.add_argument('--cachedir', metavar='PATH', help='Path to cache directory')
+        group.add_argument('--cache-backend', choices=['file', 'sqlite'], help='Store the cache as individual files, or in a single sqlite database (default: file)')
+        group.add_argument('--cache-daemon', action='store_true', help='Keep cached data in memory, in a background process shared by all ezaz commands (also enabled by setting EZAZ_CACHE_DAEMON)')
+        group.add_argument('--no-az-worker', action='store_true', help='Run each az command in a new process, instead of reusing a persistent az worker process')
+        group.add_argument('--az-retries', metavar='N', type=int, help='Retry throttled or failed az commands up to N times (default: 5)')
+        group.add_argument('--az-record', metavar='PATH', help='Record all az commands and their output into this directory (see ezaz/azrecord.py)')
+        group.add_argument('--query-projection', action='store_true', help='Request only the info fields that are used from az show and list commands (these results are not cached)')
+        group.add_argument('--az-jobs', metavar='N', type=int, help='Run up to N az commands in parallel (default: 4)')
 
         from .config import Config
         Config.add_argument_to_parser(group, '-C', '--configfile', metavar='PATH')
@@ -154,6 +194,9 @@ def main():
     no_venv = getattr(options, 'no_venv', False)
     debug_timing = getattr(options, 'debug_timing', False)
 
+    if debug_timing:
+        AZ_PROFILER.enabled = True
+
     from .importvenv import ImportVenv
     with ImportVenv(debug=debug_venv, refresh=refresh_venv, no_venv=no_venv) as venv:
         from . import LOGGER
@@ -178,5 +221,6 @@ def main():
         finally:
             if debug_timing:
                 TIMESTAMP.show()
+                AZ_PROFILER.show()
 
         return -1
@@ -1,3 +1,4 @@
+import json
 
 
 def OBJ(_required_keys=None, /, **properties):
@@ -20,3 +21,45 @@ BOOL = { "type": "boolean" }
 STR = { "type": "string" }
 NUM = { "type": "number" }
 NULL = { "type": "null" }
+
+def _jmespath_identifier(name):
+    # JMESPath quoted identifiers use json string quoting
+    return json.dumps(name)
+
+def _object_projection(schema):
+    properties = schema.get('properties') if schema.get('type') == 'object' else None
+    if not properties:
+        return None
+    return '{' + ', '.join(f'{_jmespath_identifier(k)}: {_field_projection(k, v)}' for k, v in properties.items()) + '}'
+
+def _field_projection(name, schema):
+    field = _jmespath_identifier(name)
+    if schema.get('type') == 'array':
+        items = _object_projection(schema.get('items', {}))
+        return f'{field}[].{items}' if items else field
+    projection = _object_projection(schema)
+    return f'{field}.{projection}' if projection else field
+
+def QUERY_PROJECTION(schema, fields=()):
+    """Return a JMESPath query that selects only the schema properties, plus
+    the entire value of each of the top-level fields (from dot-separated paths).
+    Returns None if the schema has no properties (i.e. everything is needed)."""
+    properties = dict(schema.get('properties', {}))
+    if not properties:
+        return None
+    for field in fields:
+        properties[field.split('.')[0]] = {}
+    return _object_projection(OBJ(**properties))
+
+def STRIP_PROJECTION(schema, obj):
+    """Remove the null values that a QUERY_PROJECTION query adds for
+    missing fields, except for required schema properties."""
+    if schema.get('type') == 'array' and isinstance(obj, list):
+        return [STRIP_PROJECTION(schema.get('items', {}), o) for o in obj]
+    properties = schema.get('properties') if schema.get('type') == 'object' else None
+    if not properties or not isinstance(obj, dict):
+        return obj
+    required = schema.get('required', [])
+    return {k: STRIP_PROJECTION(properties.get(k, {}), v)
+            for k, v in obj.items()
+            if v is not None or k in required}
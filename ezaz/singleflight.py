@@ -0,0 +1,56 @@
+
+import threading
+
+
+class SingleFlightCall:
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def run(self, fn, *args, **kwargs):
+        try:
+            self._result = fn(*args, **kwargs)
+        except Exception as e:
+            self._exception = e
+        finally:
+            self._done.set()
+
+    def result(self):
+        self._done.wait()
+        if self._exception:
+            raise self._exception
+        return self._result
+
+
+class SingleFlight:
+    # All calls with the same key share the result of one call, whether
+    # they are concurrent or repeated later, until cleared; a failed
+    # call's exception is shared only with the concurrent calls, so a
+    # later call runs again
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def clear(self):
+        # Any call still in progress is just forgotten, so its result
+        # won't be used by any later call
+        with self._lock:
+            self._calls = {}
+
+    def __call__(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            run = call is None
+            if run:
+                call = self._calls[key] = SingleFlightCall()
+        if run:
+            call.run(fn, *args, **kwargs)
+            if call._exception:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+        return call.result()
+
+
+AZ_SINGLE_FLIGHT = SingleFlight()
@@ -0,0 +1,115 @@
+
+import heapq
+import threading
+import time
+
+from itertools import count
+
+from . import LOGGER
+from .azexecutor import AZ_EXECUTOR
+from .exception import WaitTimeout
+
+
+class AzWaitTarget:
+    def __init__(self, azobject, condition, timeout, interval):
+        self.azobject = azobject
+        self.condition = condition
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.interval = interval
+        self.state = None
+        self.result = None
+        self.exception = None
+        self.done = threading.Event()
+
+    def finish(self, *, result=None, exception=None):
+        self.result = result
+        self.exception = exception
+        self.done.set()
+
+
+class AzWaiter:
+    # All waits share a single scheduler thread, which polls all of
+    # the due objects together, in parallel. Each object's poll
+    # interval increases while its state isn't changing, and resets to
+    # the minimum when it changes.
+    MIN_INTERVAL = 2.0
+    MAX_INTERVAL = 30.0
+    BACKOFF = 1.5
+    # Objects due within this long are polled in the same batch
+    BATCH_WINDOW = 1.0
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = count()
+        self._thread = None
+
+    def _schedule(self, target, due):
+        with self._cond:
+            heapq.heappush(self._queue, (due, next(self._seq), target))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ezaz-waiter', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._queue and self._queue[0][0] <= now:
+                    break
+                self._cond.wait(self._queue[0][0] - now if self._queue else None)
+            batch = []
+            while self._queue and self._queue[0][0] <= now + self.BATCH_WINDOW:
+                batch.append(heapq.heappop(self._queue)[2])
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            futures = [AZ_EXECUTOR.submit(target.azobject.wait_check, target.condition) for target in batch]
+            for target, future in zip(batch, futures):
+                self._update(target, future)
+
+    def _update(self, target, future):
+        try:
+            done, state = future.result()
+        except Exception as e:
+            target.finish(exception=e)
+            return
+
+        azobject = target.azobject
+        if state == target.state:
+            target.interval = min(self.MAX_INTERVAL, target.interval * self.BACKOFF)
+        else:
+            LOGGER.info(f'{azobject.azobject_text()} {azobject.azobject_id}: {state}')
+            target.interval = self.MIN_INTERVAL
+        target.state = state
+
+        if done:
+            target.finish(result=state)
+            return
+
+        now = time.monotonic()
+        if target.deadline and now >= target.deadline:
+            target.finish(exception=WaitTimeout(azobject.azobject_text(), azobject.azobject_id, target.condition, state))
+            return
+
+        due = now + target.interval
+        self._schedule(target, min(due, target.deadline) if target.deadline else due)
+
+    def wait(self, azobjects, condition, *, timeout=None):
+        # Returns the final state of each object, once all are done
+        targets = [AzWaitTarget(azobject, condition, timeout, self.MIN_INTERVAL) for azobject in azobjects]
+        now = time.monotonic()
+        for target in targets:
+            self._schedule(target, now)
+        for target in targets:
+            target.done.wait()
+        for target in targets:
+            if target.exception:
+                raise target.exception
+        return [target.result for target in targets]
+
+
+AZ_WAITER = AzWaiter()